@@ -0,0 +1,165 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+
+# Number of proxies in front of the app (1 on Heroku). Clients are told apart by the
+# address the last trusted proxy saw; with none trusted, every request behind a
+# router comes from the router, so the per-client rate limits default to off.
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", "0"))
+
+
+def _limit(name, default):
+    # "rate:burst" in requests per second; a rate of 0 turns the limit off
+    rate, _, burst = os.environ.get(name, default if TRUSTED_PROXIES else "0").partition(":")
+    rate = float(rate)
+    return rate, float(burst or max(rate, 1.0))
+
+
+# Endpoint groups share a bucket and a concurrency limit
+RATE_LIMITS = {
+    "generate": _limit("RATE_LIMIT_GENERATE", "20:40"),
+    "pdf": _limit("RATE_LIMIT_PDF", "5:10"),
+    "contact": _limit("RATE_LIMIT_CONTACT", "0.05:3"),
+}
+# Requests one worker process handles at once (gunicorn.conf.py reads the same setting).
+# A concurrency limit can only be reached below that, so under the default single
+# threaded sync workers they are all off. With threads, PDF requests get at most half of
+# them and /generate keeps the rest. Async workers need the limits set explicitly.
+WORKER_THREADS = int(os.environ.get("GUNICORN_THREADS", "1"))
+CONCURRENCY_LIMITS = {
+    "generate": int(os.environ.get("CONCURRENCY_LIMIT_GENERATE", "0")),
+    "pdf": int(os.environ.get("CONCURRENCY_LIMIT_PDF", str(WORKER_THREADS // 2))),
+    "contact": int(os.environ.get("CONCURRENCY_LIMIT_CONTACT", "0")),
+}
+# "local" keeps buckets per process; "shared" keeps them in memory mapped before
+# gunicorn forks (preload_app), so a client's budget is shared by every worker
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "local")
+RATE_LIMIT_CLIENTS = int(os.environ.get("RATE_LIMIT_CLIENTS", "65536"))
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _refill(tokens, last, now, rate, burst):
+    return min(burst, tokens + (now - last) * rate)
+
+
+class LocalBuckets:
+    # Token buckets in a dict, oldest-touched first. When full, the least recently
+    # seen client is dropped; it comes back with a full bucket, which is what an idle
+    # client would have had anyway.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst, now):
+        # Returns 0 when a token was taken, else the seconds until one is available
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            tokens = burst if bucket is None else _refill(*bucket, now, rate, burst)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.capacity:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SharedBuckets:
+    # A fixed-size open hash table of (key hash, tokens, last refill) slots in an
+    # anonymous shared mapping. It must be created before the workers fork. A slot
+    # collision hands the slot to the newer client, which at worst lets one of the
+    # two start over with a full bucket.
+    SLOT = struct.Struct("<Qdd")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._memory = mmap.mmap(-1, capacity * self.SLOT.size)
+        self._lock = multiprocessing.Lock()
+
+    def take(self, key, rate, burst, now):
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        offset = (digest % self.capacity) * self.SLOT.size
+        with self._lock:
+            slot_key, tokens, last = self.SLOT.unpack_from(self._memory, offset)
+            tokens = burst if slot_key != digest else _refill(tokens, last, now, rate, burst)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / rate
+            self.SLOT.pack_into(self._memory, offset, digest, tokens, now)
+            return wait
+
+
+def _make_buckets():
+    if RATE_LIMIT_BACKEND == "shared":
+        return SharedBuckets(RATE_LIMIT_CLIENTS)
+    if RATE_LIMIT_BACKEND == "local":
+        return LocalBuckets(RATE_LIMIT_CLIENTS)
+    raise ValueError("RATE_LIMIT_BACKEND must be 'local' or 'shared'")
+
+
+buckets = _make_buckets()
+_in_flight = {group: 0 for group in CONCURRENCY_LIMITS}
+_in_flight_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {(group, reason): 0 for group in RATE_LIMITS for reason in ("rate_limited", "concurrency")}
+
+
+def _reject(group, status, reason, retry_after):
+    with _stats_lock:
+        _stats[group, reason] += 1
+    raise Rejected(status, reason, retry_after)
+
+
+def admit(group, client):
+    # Takes a token from the client's bucket and a concurrency slot for the group,
+    # raising Rejected (429 or 503) instead; call release(group) when the request ends
+    rate, burst = RATE_LIMITS[group]
+    if rate > 0:
+        wait = buckets.take(f"{group}:{client}", rate, burst, time.monotonic())
+        if wait:
+            _reject(group, 429, "rate_limited", wait)
+    limit = CONCURRENCY_LIMITS[group]
+    with _in_flight_lock:
+        if limit and _in_flight[group] >= limit:
+            busy = True
+        else:
+            busy = False
+            _in_flight[group] += 1
+    if busy:
+        _reject(group, 503, "concurrency", 1.0)
+
+
+def release(group):
+    with _in_flight_lock:
+        _in_flight[group] -= 1
+
+
+def in_flight():
+    with _in_flight_lock:
+        return {(group,): count for group, count in _in_flight.items()}
+
+
+def rejections():
+    with _stats_lock:
+        return dict(_stats)
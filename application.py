@@ -1,49 +1,177 @@
-from textwrap import wrap
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from io import BytesIO
-from flask import Flask, render_template, jsonify, request, send_file
-import smtplib
+# First, before any module reads its settings from the environment on import
 from dotenv import load_dotenv
+load_dotenv()
+
+from flask import Flask, Response, abort, g, render_template, jsonify, request, send_file, stream_with_context
+import smtplib
 from email.mime.text import MIMEText
 import random
 import os
+import base64
+import gzip
+import hashlib
+import json
+import math
+import string
+import struct
+import threading
+import logging
+import re
+import time
+import zipfile
+from collections import deque
+from functools import lru_cache
+from io import BytesIO
+from types import MappingProxyType
+from werkzeug.middleware.proxy_fix import ProxyFix
+import numpy as np
+from dice import STAT_ENGINES, STAT_METHODS, roll_stats_batch, stat_distribution
+from permutation import PermutationWalk, mix64
+from progression import (MAX_LEVEL, PROGRESSION_COLUMNS, ability_modifier, build_progression_tables,
+                         level_bonus)
+from sampling import AliasTable, hashed_uniform
+from character_sheet import SHEET_FIELDS, render_sheet_bytes, render_sheet_with_timings, render_sheets_pdf
+import admission
+import mail_queue
+import metrics
+import name_model
+import pdf_cache
+import prefetch
+import render_pool
+import roster
+try:
+    import brotli
+except ImportError:
+    brotli = None
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
 app = Flask(__name__)
 application = app
 
-def load_race_name_pool(race, folder_path=None):
-    if folder_path is None:
-        folder_path = os.path.join(os.path.dirname(__file__), "race_names")
+# Bodies over this are refused with 413 before they are read
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", str(4 * 1024 * 1024)))
+# So rate limits see the real client address rather than the proxy's
+if admission.TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=admission.TRUSTED_PROXIES)
 
-    normalized_race = race.lower().replace(" ", "").replace("-", "")
-    print(f"[DEBUG 1] Race passed to name loader: '{race}'")
-    print(f"[DEBUG 2] Normalized race name: '{normalized_race}'")
+logger = logging.getLogger("dndproject")
+logger.addHandler(logging.StreamHandler())
+logger.propagate = False
+logger.setLevel(os.environ.get("LOG_LEVEL", "WARNING").upper())
 
-    first_path = os.path.join(folder_path, f"{normalized_race}_first.txt")
-    last_path = os.path.join(folder_path, f"{normalized_race}_last.txt")
-    
-    print(f"[DEBUG 3] Checking for files:")
-    print(f"  First: {first_path}")
-    print(f"  Last: {last_path}")
-    print(f"[DEBUG 4] First exists? {os.path.exists(first_path)}")
-    print(f"[DEBUG 5] Last exists? {os.path.exists(last_path)}")
-
-    if not os.path.exists(first_path) or not os.path.exists(last_path):
-        print("[DEBUG 6] One or both files missing. Falling back to generic names.")
-        return (
-            ["Arin", "Lira", "Thorne", "Kara", "Dain", "Mira", "Jarek", "Sylva"],
-            ["Ironwood", "Duskblade", "Stormborn", "Brightflame", "Shadowstep", "Frostbane"]
-        )
+if not admission.TRUSTED_PROXIES and any(rate > 0 for rate, _ in admission.RATE_LIMITS.values()):
+    logger.warning("Rate limits are on but TRUSTED_PROXIES is 0; behind a proxy or router every "
+                   "client shares one bucket. Set TRUSTED_PROXIES to the number of proxies in front.")
 
-    with open(first_path, 'r', encoding='utf-8') as f:
-        first_names = [line.strip() for line in f if line.strip()]
-    
-    with open(last_path, 'r', encoding='utf-8') as f:
-        last_names = [line.strip() for line in f if line.strip()]
-    
-    return first_names, last_names
+NAMES_DIR = os.path.join(script_dir, "race_names")
+
+GENERIC_NAME_POOL = (
+    ("Arin", "Lira", "Thorne", "Kara", "Dain", "Mira", "Jarek", "Sylva"),
+    ("Ironwood", "Duskblade", "Stormborn", "Brightflame", "Shadowstep", "Frostbane")
+)
+
+# "markov" spells new names from models trained on the race_names files; "pool" picks
+# from the files as they are
+NAME_GENERATOR = os.environ.get("NAME_GENERATOR", "markov")
+
+# Races whose display name doesn't normalize to the stem of their race_names files
+RACE_NAME_ALIASES = {
+    "yuantipureblood": "yuanti",
+}
+
+def normalize_race(race):
+    return race.lower().replace(" ", "").replace("-", "")
+
+def _read_names(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return tuple(line.strip() for line in f if line.strip())
+
+def build_name_index(folder_path):
+    index = {}
+    for filename in sorted(os.listdir(folder_path)):
+        if not filename.endswith("_first.txt"):
+            continue
+        stem = filename[:-len("_first.txt")]
+        last_path = os.path.join(folder_path, f"{stem}_last.txt")
+        if not os.path.exists(last_path):
+            logger.warning("Skipping name pool '%s': no matching _last.txt", stem)
+            continue
+        first_names = _read_names(os.path.join(folder_path, filename))
+        last_names = _read_names(last_path)
+        if first_names and last_names:
+            index[normalize_race(stem)] = (first_names, last_names)
+    return MappingProxyType(index)
+
+
+class NamePoolIndex:
+    # Name pools keyed by normalized race, read once. With watch=True the folder is
+    # re-stat'ed at most every `interval` seconds and the index swapped on change.
+    def __init__(self, folder_path, watch=False, interval=1.0):
+        self.folder_path = folder_path
+        self.watch = watch
+        self.interval = interval
+        self._signature = self._scan()
+        self._index = build_name_index(folder_path)
+        self._model = None
+        self._next_check = time.monotonic() + interval
+
+    def _scan(self):
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(self.folder_path) if entry.name.endswith(".txt")
+        ))
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.interval
+        signature = self._scan()
+        if signature != self._signature:
+            self._index = build_name_index(self.folder_path)
+            self._model = None
+            self._signature = signature
+            logger.info("Reloaded name pools from %s (%d races)", self.folder_path, len(self._index))
+
+    def key(self, race):
+        key = normalize_race(race)
+        return RACE_NAME_ALIASES.get(key, key)
+
+    def name_model(self):
+        # Compiled (or loaded from NAME_MODEL_CACHE_DIR) on first use and after a reload
+        if self.watch:
+            self._reload_if_changed()
+        model = self._model
+        if model is None:
+            model = self._model = name_model.load_or_train(self._index, GENERIC_NAME_POOL)
+        return model
+
+    def get(self, race):
+        if self.watch:
+            self._reload_if_changed()
+        key = self.key(race)
+        pool = self._index.get(key)
+        if pool is None:
+            logger.debug("No name pool for '%s' (key '%s'); using generic names", race, key)
+            return GENERIC_NAME_POOL
+        logger.debug("Name pool for '%s' -> '%s'", race, key)
+        return pool
+
+
+name_pools = NamePoolIndex(
+    NAMES_DIR,
+    watch=os.environ.get("NAME_POOL_WATCH", "0") == "1",
+    interval=float(os.environ.get("NAME_POOL_WATCH_INTERVAL", "1.0")),
+)
+_extra_name_pools = {}
+
+def load_race_name_pool(race, folder_path=None):
+    if folder_path is None or os.path.abspath(folder_path) == NAMES_DIR:
+        return name_pools.get(race)
+    folder_path = os.path.abspath(folder_path)
+    if folder_path not in _extra_name_pools:
+        _extra_name_pools[folder_path] = NamePoolIndex(folder_path)
+    return _extra_name_pools[folder_path].get(race)
     
 
 # Sample data sets
@@ -73,17 +201,6 @@ themes = [
     {"name": "Arcane Whispers", "colors": ["#6A5ACD", "#8A2BE2", "#4B0082"]},
     {"name": "Nature's Wrath", "colors": ["#228B22", "#556B2F", "#8FBC8F"]}
 ]
-hair_colors = ["jet black", "silver", "fiery red", "golden blond", "deep brown", "ash gray", "blue-tinted"]
-eye_colors = ["emerald green", "icy blue", "amber", "violet", "hazel", "stormy gray", "piercing black"]
-body_mods = ["a nose ring", "a lip piercing", "a set of ear cuffs", "an intricate tattoo sleeve", "a ritualistic scar", "a hidden brand"]
-clothing_details = [
-    "a cloak patterned with falling stars", 
-    "boots stitched with runes", 
-    "a belt adorned with teeth of beasts", 
-    "a robe that shifts in color",
-    "a scarf woven with moonlight thread"
-]
-
 hit_dice = {
     "Barbarian": 12,
     "Fighter": 10, "Paladin": 10, "Ranger": 10,
@@ -91,371 +208,145 @@ hit_dice = {
     "Sorcerer": 6, "Wizard": 6
 }
    
-def generate_stats(level):
-    stats = {}
-    for stat in ["STR", "DEX", "CON", "INT", "WIS", "CHA"]:
-        rolls = sorted([random.randint(1, 6) for _ in range(4)])[1:]
-        stats[stat] = sum(rolls) + (level // 2)
-    return stats
-
-# Tiefling specific appearance
-def generate_tiefling_appearance():
-    skin_colors = [
-        "obsidian black", "lavender-toned", "deep crimson", "dusky violet",
-        "ashen gray", "burnt umber", "steel gray", "cracked magma-like", 
-        "coal-dark", "amethyst-toned"
-    ]
-
-    eye_descriptions = [
-        "eyes that burn like embers of Avernus",
-        "glowing silver eyes, touched by the Silver Void",
-        "molten gold eyes from the Nine Hells",
-        "twin void-black eyes that reflect no light",
-        "eyes flickering with blue flame from the Plane of Fire",
-        "green-glowing eyes reminiscent of the Shadowfell",
-        "lidless fiery orange eyes, predatory and intense",
-        "pale blue eyes that chill the soul",
-        "star-like eyes that shimmer with distant light"
-    ]
-
-    horn_styles = [
-        "ram-like horns etched with infernal runes",
-        "spiraled horns like a crown",
-        "jagged horns, chipped from battle",
-        "short, forward-curving horns",
-        "flame-shaped horns twisted like stone",
-        "blade-like horns polished to a shine",
-        "one horn cracked or broken — a mark of rebellion",
-        "horns engraved with celestial constellations"
-    ]
-
-    tattoos = [
-        "arcane glyphs trailing across their back",
-        "a tattoo of broken chains up their arm",
-        "infernal verses inked from jaw to collarbone",
-        "burning chain patterns looped around their limbs",
-        "sigils of old pacts glowing faintly",
-        "a fiendish contract torn in half, inked across their chest",
-        "celestial names crossed out in infernal script"
-    ]
-
-    scars = [
-        "a charred ritual brand beneath one eye",
-        "a faded scar slicing through one eyebrow",
-        "a missing horn tip, sheared in defiance",
-        "burns from pact-severing flames",
-        "arcane branding from an infernal rite"
-    ]
-
-    clothing = [
-        "a high-collared coat singed at the hem",
-        "tattered robes enchanted for flame resistance",
-        "layered leather armor with scorched silver filigree",
-        "a cloak clasped with a pentagram-shaped brooch",
-        "sleeveless garb swaying like smoke",
-        "boots partially melted and reinforced with demonhide"
-    ]
-
-    # Random selection
-    skin = random.choice(skin_colors)
-    eyes = random.choice(eye_descriptions)
-    horns = random.choice(horn_styles)
-    tattoo = random.choice(tattoos)
-    scar = random.choice(scars)
-    clothes = random.choice(clothing)
-
-    # Final description
-    description = (
-        f"This Tiefling has {skin} skin and {horns}. "
-        f"They have {eyes}, and {tattoo}. "
-        f"{scar.capitalize()}, and they wear {clothes}."
-    )
-
-    return description
-
-# Example use
-print(generate_tiefling_appearance())
-
-def generate_appearance(race, theme_name): 
-    if race == "Tiefling":
-        return generate_tiefling_appearance()
-    
-    
-    elif race == "Dragonborn":
-        scale_colors = ["bronze", "emerald", "obsidian", "ruby red", "sapphire blue", "glacial white", "burnished gold"]
-        build = random.choice(["broad-shouldered", "towering", "serpentine", "muscle-ridged"])
-        tail_detail = random.choice(["a ridged tail tipped in steel", "a thick tail used for balance", "a scaled tail adorned with ritual beads"])
-        clothing = random.choice(["a battle-worn sash across the chest", "a tunic split for movement", "an armored cloak pinned with a claw-shaped clasp"])
-        return f"has {random.choice(scale_colors)} scales, a {build} frame, {tail_detail}, and wears {clothing} reflecting the {theme_name} theme."
-    
-    elif race == "Elf":
-        skin_tones = ["porcelain-pale", "sun-kissed bronze", "silver-hued", "moonlight-pale"]
-        eyes = ["amber eyes that seem to pierce the veil", "glowing green eyes like a forest spirit", "stormy blue eyes full of memory"]
-        hair_styles = ["braided platinum hair", "long silken black hair", "wavy auburn hair with leaf ornaments"]
-        clothing = ["a flowing robe stitched with constellations", "a moss-lined cloak", "a tunic woven from spider silk"]
-        return f"has {random.choice(skin_tones)} skin, {random.choice(eyes)}, {random.choice(hair_styles)}, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-        
-    elif race == "Dwarf":
-        beard_styles = ["a thick braided beard wrapped in gold rings", "a forked beard stained with soot", "a trimmed beard with hidden runes"]
-        skin_tones = ["ruddy skin", "stone-gray complexion", "weathered tan skin"]
-        clothing = ["a smith's apron engraved with clan markings", "a reinforced vest of chainmail and leather", "a cloak lined with wolf fur"]
-        return f"has {random.choice(skin_tones)}, {random.choice(beard_styles)}, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-        
-    elif race == "Gnome":
-        skin_tones = ["rosy-cheeked", "light olive", "nut-brown"]
-        eyes = ["bright sapphire eyes", "twinkling green eyes", "curious hazel eyes"]
-        hair_styles = ["a frizzled mess of chestnut curls", "neatly parted silver hair", "a shocking teal mohawk"]
-        clothing = ["a vest full of gear loops", "patched robes with arcane symbols", "boots with spring-loaded heels"]
-        return f"has {random.choice(skin_tones)} skin, {random.choice(eyes)}, {random.choice(hair_styles)}, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-        
-    elif race == "Halfling":
-        features = ["freckles scattered across the nose", "a perpetual grin", "dirt-smudged cheeks"]
-        hair_styles = ["curly sandy hair", "dark brown hair tied in a ribbon", "short copper-red hair"]
-        clothing = ["a tunic with too many pockets", "a scarf that doubles as a sling", "an oversized waistcoat"]
-        return f"has {random.choice(features)}, {random.choice(hair_styles)}, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-        
-    elif race == "Half-Elf":
-        features = ["a sharp jawline softened by kindness", "mismatched eyes", "ears subtly pointed"]
-        skin_tones = ["lightly tanned", "peach-toned", "faintly silvered"]
-        hair_styles = ["straight golden locks", "shoulder-length raven hair", "loose curls dyed with streaks of blue"]
-        clothing = ["an elegant coat with family crests", "a travel-worn cape that hints at nobility", "robes sewn with dual heritage motifs"]
-        return f"has {random.choice(skin_tones)} skin, {random.choice(features)}, {random.choice(hair_styles)}, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-        
-    elif race == "Half-Orc":
-        features = ["a broken tusk from battle", "a jagged scar over one eyebrow", "green-gray skin weathered by conflict"]
-        build = ["massive shoulders", "a towering frame", "a powerfully thick neck"]
-        clothing = ["fur-lined leathers", "a war kilt made from beast hide", "a chain-wrapped gauntlet over one arm"]
-        return f"has {random.choice(features)}, {random.choice(build)}, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-        
-    elif race == "Human":
-        skin_tones = ["light caramel", "sun-bronzed", "pale freckled", "olive-toned"]
-        eyes = ["amber-flecked", "ice blue", "hazel-green"]
-        hair = ["short-cropped", "long and braided", "shaved at the sides"]
-        clothing = ["a doublet with noble trim", "a threadbare cloak stitched by hand", "a surcoat bearing a faded sigil"]
-        return f"has {random.choice(skin_tones)} skin, {random.choice(eyes)} eyes, {random.choice(hair)} hair, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-
-    elif race == "Aarakocra":
-        feather_colors = ["snow-white", "fiery red and gold", "storm-gray", "deep jungle green"]
-        eye_types = ["hawk-like yellow eyes", "piercing black eyes", "sun-bright eyes with no pupil"]
-        clothing = ["a sash covered in tribal beads", "light leather harnesses", "a mantle made of bones and feathers"]
-        return f"has {random.choice(feather_colors)} feathers, {random.choice(eye_types)}, and wears {random.choice(clothing)} reflecting the {theme_name} theme."
-    
-    elif race == "Kenku":
-        skin = "feathers in soot-black and streaked rust-red"
-        eyes = "gleaming black eyes full of mimicry's mischief"
-        mod = "a series of claw-etched glyphs along their wings"
-        clothes = "a patchwork cloak stitched from stolen banners"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-    
-    elif race == "Kobold":
-        skin = "scale patterns of dull copper and ember-flecked brown"
-        eyes = "narrow slits glowing faintly with cunning"
-        mod = "a crude earring looped through one frilled ear"
-        clothes = "a harness of leather scraps adorned with tiny charms"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Leonin":
-        fur = "golden fur streaked with storm-gray around the muzzle"
-        eyes = "amber eyes that pierce with pride"
-        mod = "braided beads and claws woven into their mane"
-        clothes = "a warcloak of lionhide and carved bone toggles"
-        return f"has {fur}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Lizardfolk":
-        skin = "scales of swamp green with hints of ochre"
-        eyes = "cold reptilian eyes that never blink"
-        mod = "a ritual scar branded across their chest"
-        clothes = "strips of hide armor held by bone clasps"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-    
-    elif race == "Minotaur":
-        fur = "coarse russet-brown fur over a stone-carved frame"
-        eyes = "burning red eyes under a heavy brow"
-        mod = "ceremonial piercings along both nostrils"
-        clothes = "shoulder armor forged from shattered axes"
-        return f"has {fur}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Orc":
-        skin = "mossy green skin marred with battle scars"
-        eyes = "steel-gray eyes hardened by conflict"
-        mod = "a war tattoo crossing their throat"
-        clothes = "a chest harness decorated with bones of past foes"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Satyr":
-        fur = "chestnut-brown fur with a silver-streaked tail"
-        eyes = "bright hazel eyes sparkling with mischief"
-        mod = "rings looped through one curled horn"
-        clothes = "a musician’s tunic covered in wine-stained embroidery"
-        return f"has {fur}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Tabaxi":
-        fur = "sleek spotted fur patterned like jungle shadows"
-        eyes = "sharp emerald eyes that miss nothing"
-        mod = "an ornate nose ring from a distant tribe"
-        clothes = "light wraps sewn with golden feline patterns"
-        return f"has {fur}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Tortle":
-        skin = "mottled teal skin with a ridged shell of brown and tan"
-        eyes = "gentle eyes deep as tidepools"
-        mod = "barnacle-like carvings along their forearms"
-        clothes = "a weathered sash slung over one shoulder, heavy with charms"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Triton":
-        skin = "pearl-blue skin with hints of coral and shimmer"
-        eyes = "sea-green eyes that pulse like the tide"
-        mod = "gill markings traced with bioluminescent ink"
-        clothes = "scaled mail glistening with oceanic hues"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-    
-    elif race == "Aasimar":
-        skin = "radiant skin that shimmers faintly in the light"
-        eyes = "pupil-less eyes glowing silver or gold"
-        mod = "a faint celestial sigil glowing beneath the collarbone"
-        clothes = "robes threaded with starlight and divine script"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Bugbear":
-        fur = "patchy fur in muddied gray and tawny shades"
-        eyes = "small, amber eyes under a heavy brow"
-        mod = "a crude iron ring pierced through one ear"
-        clothes = "strapped-together hides still bearing old battle stains"
-        return f"has {fur}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Centaur":
-        skin = "bronzed upper skin atop a dappled equine lower body"
-        eyes = "keen brown eyes with a glint of wilderness"
-        mod = "leather cords braided into the tail and mane"
-        clothes = "a chest harness fitted with pouches and tribal carvings"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Firbolg":
-        skin = "earthy blue-gray skin with moss-like undertones"
-        eyes = "soft violet eyes that glow gently in dim light"
-        mod = "floral tattoos blooming across broad shoulders"
-        clothes = "a druidic cloak woven from forest leaves and bark"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Genasi":
-        skin = "elementally touched skin — cracked stone, flowing water, flickering flame, or swirling wind patterns"
-        eyes = "elemental eyes devoid of pupils, glowing with inner energy"
-        mod = "veins or hair that spark, ripple, or drift with their elemental type"
-        clothes = "attire shaped from raw elemental materials like obsidian, mist-thread, or charcloth"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Goblin":
-        skin = "sickly green skin covered in scrapes and smudges"
-        eyes = "wide yellow eyes brimming with mischief"
-        mod = "an oversized nose ring or bone needle through the ear"
-        clothes = "rag-tag leathers and belts filled with stolen trinkets"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Goliath":
-        skin = "stone-like gray skin marbled with darker patches"
-        eyes = "ice-blue or pale green eyes, sharp and assessing"
-        mod = "tribal tattoos that trace strength and victory"
-        clothes = "minimalist furs or armor etched with clan symbols"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Hobgoblin":
-        skin = "deep crimson or slate-colored skin stretched taut over wiry muscle"
-        eyes = "narrow golden eyes brimming with discipline"
-        mod = "military brands scorched into one shoulder"
-        clothes = "rigid uniforms trimmed in rank-bands and polished steel"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Warforged":
-        plating = "worn steel plating engraved with arcane sigils"
-        eyes = "glowing blue or red eye-lenses built into their helm-like head"
-        mod = "runic cores visible through chest slats"
-        clothes = "utility wraps and reinforced belts built into their frame"
-        return f"has {plating}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Yuan-ti Pureblood":
-        skin = "pale skin with serpent scale patches across the neck and arms"
-        eyes = "slitted emerald or gold eyes that never blink"
-        mod = "fang tattoos and subtle forked tongue movements"
-        clothes = "silken robes layered in serpentine patterns and jeweled cuffs"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Changeling":
-        skin = "smooth pale-gray skin shifting subtly with emotion"
-        eyes = "solid color eyes — black, white, or violet — without iris"
-        mod = "a barely perceptible ripple beneath their features"
-        clothes = "adaptive clothing that mirrors nearby styles and cultures"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Kalashtar":
-        skin = "lightly glowing skin with a faint ethereal shimmer"
-        eyes = "serene eyes lit with a quiet inner light"
-        mod = "ghostly wisps trailing from their hair when calm or focused"
-        clothes = "robes or armor stylized with dream-motif embroidery"
-        return f"has {skin}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-
-    elif race == "Shifter":
-        features = "feral features — elongated canines, tufted ears, and claw-like nails"
-        eyes = "animalistic eyes that shift hue with emotion"
-        mod = "patches of fur or bristles along arms and back"
-        clothes = "clothing reinforced with stretchable leather, fit for rapid movement"
-        return f"has {features}, {eyes}, {mod}, and wears {clothes} reflecting the {theme_name} theme."
-        
-    
-    # Fallback for races not yet implemented
-    else:
-        hair = random.choice(hair_colors)
-        eyes = random.choice(eye_colors)
-        mod = random.choice(body_mods)
-        clothing = random.choice(clothing_details)
-        return f"has {hair} hair, {eyes} eyes, {mod}, and wears {clothing} reflecting the {theme_name} theme."
-
-def generate_backstory(name, race, char_class, background, appearance, personal_item):
-    backstory_openings = [
-        "Born of the {race} bloodline, {name} defied what was expected of them and chose the path of the {char_class}.",
-        "Where most {race}s cling to tradition, {name} pursued the unorthodox life of a {char_class}.",
-        "{name} never fit the mold of a typical {race} — their heart beat to the rhythm of the {char_class}.",
-        "Among the {race}, it’s rare to find a {char_class}. Rarer still is one as driven as {name}.",
-        "The {char_class}'s path is not common for a {race}, but {name} was never one for common roads.",
-        "{name} was shaped by {race} roots, but the calling of the {char_class} reshaped their destiny.",
-        "Though born a {race}, {name} felt a spark — a pull toward the way of the {char_class}.",
-        "The traditions of the {race}s taught discipline, but {name} found freedom in the chaos of a {char_class}'s journey.",
-        "{name}'s kin walked the path of predictability. They chose another — one forged in the fires of the {char_class}.",
-        "While their blood whispered the old ways of the {race}, {name} listened instead to the beckoning of the {char_class}."
-    ]
-
-    events = [
-        "was exiled from their homeland",
-        "survived a betrayal within their guild",
-        "was chosen by a mysterious prophecy",
-        "endured trials in a cursed forest",
-        "escaped an ancient beast’s wrath",
-        "lost their voice to a magical pact"
-    ]
-    
-    goals = [
-        "seeks to reclaim their lost honor",
-        "wants to uncover a forbidden truth",
-        "hopes to reunite with their family",
-        "aims to bring peace to their homeland",
-        "is on a quest for self-discovery",
-        "protects those who cannot protect themselves"
-    ]
-    
-    quirks = [
-        "recites lullabies in battle",
-        "collects feathers from every journey",
-        "talks to their weapon as if it were alive",
-        "has a deep fear of mirrors",
-        "writes messages on stones and leaves them behind",
-        "wears mismatched gloves intentionally"
-    ]
-
-    # Pick and format dynamic intro
-    opening = random.choice(backstory_openings).format(name=name, race=race, char_class=char_class)
-    event = random.choice(events)
-    goal = random.choice(goals)
-    quirk = random.choice(quirks)
+# How 4d6 scores are produced: "dice" rolls and drops the lowest die, "alias" samples the
+# exact distribution directly. The other methods always use their precomputed tables.
+# New characters use this one; a share code carries the engine it was made with.
+STATS_ENGINE = os.environ.get("STATS_ENGINE", "dice")
+if STATS_ENGINE not in STAT_ENGINES:
+    raise ValueError(f"STATS_ENGINE must be one of {', '.join(STAT_ENGINES)}")
+DEFAULT_STATS_METHOD = "4d6"
+
+def generate_stats(level, rng=random, method=DEFAULT_STATS_METHOD):
+    return roll_stats_batch([rng.getrandbits(64)], level, as_dicts=True, method=method, engine=STATS_ENGINE)[0]
+
+# Stats are keyed off the character seed rather than drawn from its rng, so a batch
+# can roll every character's abilities in one array operation
+def roll_character_stats(seeds, level, method=DEFAULT_STATS_METHOD, engine=STATS_ENGINE):
+    return roll_stats_batch(np.asarray(seeds, dtype=np.uint64), level, as_dicts=True,
+                            method=method, engine=engine)
+
+# Hit points, proficiency bonus and ASI levels for every class and base CON score,
+# built once; a character's progression is a single lookup
+PROGRESSION_TABLES = build_progression_tables(hit_dice, default_hit_die=8)
+PREVIEW_LEVEL = 12
+
+# Appearance trait tables, compiled once. Each race's template becomes a small function
+# that draws the varying traits in order and returns an f-string with the fixed traits
+# already inlined. Adding a race only needs an entry in appearance_traits.json.
+APPEARANCE_DATA_PATH = os.path.join(script_dir, "appearance_traits.json")
+
+def _compile_appearance(name, entry, default_template):
+    template = entry.get("template", default_template)
+    traits = entry["traits"]
+    namespace = {}
+    draws = []
+    slots = {}
+    for field, values in traits.items():
+        if isinstance(values, list):
+            slot = slots[field] = f"t{len(draws)}"
+            namespace[f"{slot}_options"] = tuple(values)
+            draws.append(f"    {slot} = choice({slot}_options)\n")
+    body = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        body.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if spec or conversion:
+            raise ValueError(f"appearance template for '{name}' uses a format spec or conversion on '{field}'")
+        if field == "theme":
+            body.append("{theme}")
+        elif field not in traits:
+            raise KeyError(f"appearance template references unknown trait '{field}'")
+        elif field in slots:
+            body.append(f"{{{slots[field]}}}")
+        else:
+            body.append(traits[field].replace("{", "{{").replace("}", "}}"))
+    source = "def appearance(choice, theme):\n" + "".join(draws) + f"    return f{''.join(body)!r}\n"
+    exec(compile(source, f"<appearance:{name}>", "exec"), namespace)
+    appearance = namespace["appearance"]
+    # Number of distinct appearances the template can produce, for unique batches
+    appearance.space = math.prod(len(values) for values in traits.values() if isinstance(values, list))
+    return appearance
+
+def load_appearance_tables(path=APPEARANCE_DATA_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    default_template = data["default_template"]
+    tables = {race: _compile_appearance(race, entry, default_template) for race, entry in data["races"].items()}
+    return MappingProxyType(tables), _compile_appearance("fallback", data["fallback"], default_template)
+
+APPEARANCE_TABLES, FALLBACK_APPEARANCE = load_appearance_tables()
+
+def generate_appearance(race, theme_name, rng=random):
+    return APPEARANCE_TABLES.get(race, FALLBACK_APPEARANCE)(rng.choice, theme_name)
+
+def generate_tiefling_appearance(rng=random):
+    return generate_appearance("Tiefling", None, rng)
+
+def _compile_opening(template):
+    # Parsed once into a printf-style string, which fills in about twice as fast as
+    # str.format re-parsing the template on every call
+    pieces = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        pieces.append(literal.replace("%", "%%"))
+        if field is None:
+            continue
+        if spec or conversion or field not in ("name", "race", "char_class"):
+            raise ValueError(f"backstory opening uses an unsupported field '{field}'")
+        pieces.append(f"%({field})s")
+    compiled = "".join(pieces)
+
+    def opening(name, race, char_class):
+        return compiled % {"name": name, "race": race, "char_class": char_class}
+    return opening
+
+BACKSTORY_OPENINGS = tuple(_compile_opening(template) for template in (
+    "Born of the {race} bloodline, {name} defied what was expected of them and chose the path of the {char_class}.",
+    "Where most {race}s cling to tradition, {name} pursued the unorthodox life of a {char_class}.",
+    "{name} never fit the mold of a typical {race} — their heart beat to the rhythm of the {char_class}.",
+    "Among the {race}, it’s rare to find a {char_class}. Rarer still is one as driven as {name}.",
+    "The {char_class}'s path is not common for a {race}, but {name} was never one for common roads.",
+    "{name} was shaped by {race} roots, but the calling of the {char_class} reshaped their destiny.",
+    "Though born a {race}, {name} felt a spark — a pull toward the way of the {char_class}.",
+    "The traditions of the {race}s taught discipline, but {name} found freedom in the chaos of a {char_class}'s journey.",
+    "{name}'s kin walked the path of predictability. They chose another — one forged in the fires of the {char_class}.",
+    "While their blood whispered the old ways of the {race}, {name} listened instead to the beckoning of the {char_class}."
+))
+
+BACKSTORY_EVENTS = (
+    "was exiled from their homeland",
+    "survived a betrayal within their guild",
+    "was chosen by a mysterious prophecy",
+    "endured trials in a cursed forest",
+    "escaped an ancient beast’s wrath",
+    "lost their voice to a magical pact"
+)
+
+BACKSTORY_GOALS = (
+    "seeks to reclaim their lost honor",
+    "wants to uncover a forbidden truth",
+    "hopes to reunite with their family",
+    "aims to bring peace to their homeland",
+    "is on a quest for self-discovery",
+    "protects those who cannot protect themselves"
+)
+
+BACKSTORY_QUIRKS = (
+    "recites lullabies in battle",
+    "collects feathers from every journey",
+    "talks to their weapon as if it were alive",
+    "has a deep fear of mirrors",
+    "writes messages on stones and leaves them behind",
+    "wears mismatched gloves intentionally"
+)
+
+BACKSTORY_SPACE = len(BACKSTORY_OPENINGS) * len(BACKSTORY_EVENTS) * len(BACKSTORY_GOALS) * len(BACKSTORY_QUIRKS)
+
+def generate_backstory(name, race, char_class, background, appearance, personal_item, rng=random):
+    opening = rng.choice(BACKSTORY_OPENINGS)(name, race, char_class)
+    event = rng.choice(BACKSTORY_EVENTS)
+    goal = rng.choice(BACKSTORY_GOALS)
+    quirk = rng.choice(BACKSTORY_QUIRKS)
 
     return (
         f"{opening} Once a {background.lower()}, they {event}. "
@@ -463,58 +354,739 @@ def generate_backstory(name, race, char_class, background, appearance, personal_
         f"They carry {personal_item}. This character {goal} and {quirk}."
     )
 
+class MixedRadixChooser:
+    # Stands in for the rng in generate_appearance/generate_backstory: each choice takes
+    # the next digit of a mixed-radix number, so every index below a race's appearance
+    # space times BACKSTORY_SPACE gives a different appearance/backstory pair
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def choice(self, options):
+        self.index, digit = divmod(self.index, len(options))
+        return options[digit]
+
+class UniqueCombinations:
+    # Hands out combination indexes for one batch without remembering past ones.
+    # Backstories walk one seeded permutation shared by the whole batch and
+    # appearances walk one per race, so neither repeats until its space runs out
+    # (then a new lap starts with a fresh permutation).
+    def __init__(self, key):
+        self.key = key
+        self.backstories = PermutationWalk(BACKSTORY_SPACE, key)
+        self.appearances = {}
+
+    def next(self, race):
+        walk = self.appearances.get(race)
+        if walk is None:
+            walk = self.appearances[race] = PermutationWalk(
+                APPEARANCE_TABLES.get(race, FALLBACK_APPEARANCE).space, mix64(self.key + len(self.appearances) + 1))
+        # Appearance draws come first, so they are the low digits
+        return self.backstories.next() * walk.size + walk.next()
+
+# Fields a request can pin, restrict or weight, in the order build_character picks them
+CHOICE_FIELDS = ("race", "class", "subclass", "gender", "background", "theme")
+PICKS_KEY = 0x2545F4914F6CDD1D
+
+def _choice_options(field):
+    if field == "subclass":
+        return [subclass for char_class in classes for subclass in subclasses[char_class]]
+    if field == "theme":
+        return [theme["name"] for theme in themes]
+    return {"race": races, "class": classes, "gender": genders, "background": backgrounds}[field]
+
+def _field_weights(field, options, rule):
+    allow, deny, weights = rule
+    weights = dict(weights)
+    return [0.0 if (allow is not None and option not in allow) or option in deny else weights.get(option, 1.0)
+            for option in options]
+
+class ChoiceConstraints:
+    # Alias tables for one set of constraints. Picks are hashed from the character
+    # seed, so they take one table lookup per field whatever the constraints are.
+    def __init__(self, rules):
+        self.tables = {}
+        for field in ("race", "gender", "background", "theme"):
+            options = _choice_options(field)
+            weights = _field_weights(field, options, rules[field])
+            if not any(weights):
+                raise ValueError(f"no {field} matches the constraints")
+            self.tables[field] = self._table(weights)
+
+        # A class is only possible if at least one of its subclasses is
+        class_weights = _field_weights("class", classes, rules["class"])
+        self.subclass_tables = []
+        for index, char_class in enumerate(classes):
+            weights = _field_weights("subclass", subclasses[char_class], rules["subclass"])
+            if any(weights) and class_weights[index]:
+                self.subclass_tables.append(self._table(weights))
+            else:
+                class_weights[index] = 0.0
+                self.subclass_tables.append(None)
+        if not any(class_weights):
+            raise ValueError("no class and subclass combination matches the constraints")
+        self.tables["class"] = self._table(class_weights)
+
+    @staticmethod
+    def _table(weights):
+        # Zero-weight options are dropped so they can never come back through rounding
+        indexes = [i for i, weight in enumerate(weights) if weight > 0]
+        return AliasTable([weights[i] for i in indexes]), indexes
+
+    @staticmethod
+    def _pick(table, key, counter):
+        alias, indexes = table
+        return indexes[alias.sample(hashed_uniform(key, counter))]
+
+    def sample(self, seed):
+        # Indexes into races, classes, subclasses[class], genders, backgrounds, themes
+        key = seed ^ PICKS_KEY
+        tables = self.tables
+        class_index = self._pick(tables["class"], key, 1)
+        return (
+            self._pick(tables["race"], key, 0),
+            class_index,
+            self._pick(self.subclass_tables[class_index], key, 2),
+            self._pick(tables["gender"], key, 3),
+            self._pick(tables["background"], key, 4),
+            self._pick(tables["theme"], key, 5),
+        )
+
+@lru_cache(maxsize=256)
+def compile_constraints(rules):
+    # rules: ((field, (allow or None, deny, weights)), ...), as built by _constraint_args
+    return ChoiceConstraints(dict(rules))
+
+def resolve_picks(picks):
+    race, class_index, subclass, gender, background, theme = picks
+    char_class = classes[class_index]
+    return (races[race], char_class, subclasses[char_class][subclass],
+            genders[gender], backgrounds[background], themes[theme])
+
+DEFAULT_PERSONAL_ITEM = "a mysterious token with a forgotten past"
+BATCH_MAX_COUNT = int(os.environ.get("BATCH_MAX_COUNT", "10000"))
+BATCH_CHUNK_SIZE = 256
+
+# Items offered by the UI get a one-byte index in share codes; anything else is stored verbatim
+PERSONAL_ITEMS = (
+    DEFAULT_PERSONAL_ITEM,
+    "a silver locket with a faded portrait",
+    "a charm bracelet from a lost sibling",
+    "a weathered book of ancient prayers",
+    "a rune-inscribed dagger hidden in their boot",
+    "a wooden token carved with their tribe's emblem",
+    "a necklace bearing the symbol of their deity",
+    "a coin from a forgotten land they dream about",
+    "a bloodstained letter they never opened",
+)
+
+# Share code layout: flags (1 byte), seed (8), level (1), combination index (8, only with
+# CODE_COMBO), constrained picks (6, only with CODE_PICKS), stats method in the low nibble
+# and stats engine in the high one (1, only with CODE_STATS), name draw (1, only with
+# CODE_NAME), then item index (1) or UTF-8 item text
+SHARE_CODE_HEADER = struct.Struct(">BQB")
+SHARE_CODE_COMBO = struct.Struct(">Q")
+SHARE_CODE_PICKS = struct.Struct(">6B")
+CODE_CUSTOM_ITEM = 0x01
+CODE_COMBO = 0x02
+CODE_PICKS = 0x04
+CODE_STATS = 0x08
+CODE_NAME = 0x10
+
+def encode_share_code(seed, level, personal_item, combo=None, picks=None, stats_method=DEFAULT_STATS_METHOD,
+                      name_draw=0, stats_engine="dice"):
+    flags = 0
+    extra = b""
+    if combo is not None:
+        flags |= CODE_COMBO
+        extra += SHARE_CODE_COMBO.pack(combo)
+    if picks is not None:
+        flags |= CODE_PICKS
+        extra += SHARE_CODE_PICKS.pack(*picks)
+    if stats_method != DEFAULT_STATS_METHOD or stats_engine != "dice":
+        flags |= CODE_STATS
+        extra += bytes([STAT_METHODS.index(stats_method) | STAT_ENGINES.index(stats_engine) << 4])
+    if name_draw:
+        flags |= CODE_NAME
+        extra += bytes([name_draw])
+    if personal_item in PERSONAL_ITEMS:
+        extra += bytes([PERSONAL_ITEMS.index(personal_item)])
+    else:
+        flags |= CODE_CUSTOM_ITEM
+        extra += personal_item.encode("utf-8")
+    payload = SHARE_CODE_HEADER.pack(flags, seed, level) + extra
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+
+def decode_share_code(code):
+    try:
+        payload = base64.urlsafe_b64decode(code + "=" * (-len(code) % 4))
+        flags, seed, level = SHARE_CODE_HEADER.unpack_from(payload)
+        offset = SHARE_CODE_HEADER.size
+        combo = None
+        if flags & CODE_COMBO:
+            (combo,) = SHARE_CODE_COMBO.unpack_from(payload, offset)
+            offset += SHARE_CODE_COMBO.size
+        picks = None
+        if flags & CODE_PICKS:
+            picks = SHARE_CODE_PICKS.unpack_from(payload, offset)
+            offset += SHARE_CODE_PICKS.size
+            resolve_picks(picks)
+        stats_method, stats_engine = DEFAULT_STATS_METHOD, "dice"
+        if flags & CODE_STATS:
+            stats_method = STAT_METHODS[payload[offset] & 0x0F]
+            stats_engine = STAT_ENGINES[payload[offset] >> 4]
+            offset += 1
+        name_draw = 0
+        if flags & CODE_NAME:
+            name_draw = payload[offset]
+            offset += 1
+        rest = payload[offset:]
+        if flags & CODE_CUSTOM_ITEM:
+            personal_item = rest.decode("utf-8")
+            if len(personal_item) > MAX_PERSONAL_ITEM_LENGTH:
+                raise ValueError("personal item too long")
+        else:
+            (item_index,) = rest
+            personal_item = PERSONAL_ITEMS[item_index]
+    except (ValueError, TypeError, IndexError, struct.error):
+        abort(400, description="invalid character code")
+    if not 1 <= level <= MAX_LEVEL:
+        abort(400, description="invalid character code")
+    return seed, level, personal_item, combo, picks, stats_method, name_draw, stats_engine
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, description=f"{name} must be an integer")
+
+def _level_arg():
+    level = _int_arg("level", 1)
+    if not 1 <= level <= MAX_LEVEL:
+        abort(400, description=f"level must be between 1 and {MAX_LEVEL}")
+    return level
+
+def _stats_method_arg():
+    method = request.args.get("stats_method", DEFAULT_STATS_METHOD)
+    if method not in STAT_METHODS:
+        abort(400, description=f"stats_method must be one of {', '.join(STAT_METHODS)}")
+    return method
+
+# Caps on text a client controls; a sheet with a huge backstory would otherwise tie up
+# a render worker laying out thousands of lines
+MAX_PERSONAL_ITEM_LENGTH = int(os.environ.get("MAX_PERSONAL_ITEM_LENGTH", "200"))
+SHEET_FIELD_MAX_LENGTH = int(os.environ.get("SHEET_FIELD_MAX_LENGTH", "200"))
+SHEET_TEXT_MAX_LENGTH = int(os.environ.get("SHEET_TEXT_MAX_LENGTH", "4000"))
+SHEET_MAX_STATS = 12
+
+def _personal_item_arg():
+    personal_item = request.args.get("personal_item", DEFAULT_PERSONAL_ITEM)
+    if len(personal_item) > MAX_PERSONAL_ITEM_LENGTH:
+        abort(400, description=f"personal_item is limited to {MAX_PERSONAL_ITEM_LENGTH} characters")
+    return personal_item
+
+def _sheet_field_ok(field, value):
+    if field == "stats":
+        return isinstance(value, dict) and len(value) <= SHEET_MAX_STATS and all(
+            len(str(stat)) + len(str(score)) <= SHEET_FIELD_MAX_LENGTH for stat, score in value.items())
+    if field == "theme":
+        return isinstance(value, dict) and isinstance(value.get("name"), str) and \
+            len(value["name"]) <= SHEET_FIELD_MAX_LENGTH
+    if field in ("appearance", "backstory"):
+        # A paragraph, or a list of bullet points
+        items = value if isinstance(value, list) else [value]
+        return all(isinstance(item, str) for item in items) and sum(map(len, items)) <= SHEET_TEXT_MAX_LENGTH
+    return isinstance(value, (str, int, float)) and len(str(value)) <= SHEET_FIELD_MAX_LENGTH
+
+def _validate_sheet(character):
+    if not isinstance(character, dict) or not all(field in character for field in SHEET_FIELDS):
+        abort(400, description=f"a character needs {', '.join(SHEET_FIELDS)}")
+    for field in SHEET_FIELDS:
+        if not _sheet_field_ok(field, character[field]):
+            abort(400, description=f"{field} is not valid or too long")
+
+ROSTER_NAME_MAX_LENGTH = 100
+
+def _roster_name(value):
+    if value is None:
+        return ""
+    if not isinstance(value, str) or len(value) > ROSTER_NAME_MAX_LENGTH:
+        abort(400, description=f"roster must be a name of at most {ROSTER_NAME_MAX_LENGTH} characters")
+    return value
+
+def _save_arg():
+    # ?save=1 keeps what was generated in the roster, under ?roster=<name> if given.
+    # Returns the roster name, or None when not saving.
+    if not _int_arg("save", 0):
+        return None
+    return _roster_name(request.args.get("roster"))
+
+def _seed_arg():
+    seed = _int_arg("seed")
+    if seed is not None and not 0 <= seed < 2 ** 64:
+        abort(400, description="seed must be between 0 and 2**64 - 1")
+    return seed
+
+@lru_cache(maxsize=None)
+def _canonical_names(field):
+    return {option.lower(): option for option in _choice_options(field)}
+
+def _name_list(field, value):
+    names = _canonical_names(field)
+    result = set()
+    for name in value.split(","):
+        canonical = names.get(name.strip().lower())
+        if canonical is None:
+            abort(400, description=f"unknown {field} '{name.strip()}'")
+        result.add(canonical)
+    return tuple(sorted(result))
+
+# Far past any useful skew, and small enough that a field's total can't overflow
+MAX_CHOICE_WEIGHT = 1e6
+
+def _weight_list(field, value):
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.rpartition(":")
+        try:
+            weight = float(weight)
+        except ValueError:
+            weight = -1.0
+        if not name or not 0 <= weight <= MAX_CHOICE_WEIGHT:
+            abort(400, description=f"{field}_weights must look like Name:weight,Name:weight "
+                                   f"with weights from 0 to {MAX_CHOICE_WEIGHT:g}")
+        (name,) = _name_list(field, name)
+        weights[name] = weight
+    return tuple(sorted(weights.items()))
+
+# Query parameter -> (field, position in that field's rule)
+CONSTRAINT_PARAMS = {}
+for _field in CHOICE_FIELDS:
+    CONSTRAINT_PARAMS[_field] = (_field, 0)
+    CONSTRAINT_PARAMS[f"{_field}_exclude"] = (_field, 1)
+    CONSTRAINT_PARAMS[f"{_field}_weights"] = (_field, 2)
+UNCONSTRAINED_RULE = (None, (), ())
+
+def _constraint_args():
+    # ?race=Elf,Dwarf allows only those, ?race_exclude=Orc rules one out and
+    # ?race_weights=Elf:3,Dwarf:0.5 reweights (unlisted options weigh 1); the same for
+    # class, subclass, gender, background and theme. None when nothing is constrained.
+    rules = {}
+    for param, value in request.args.items():
+        target = CONSTRAINT_PARAMS.get(param)
+        if target is None:
+            continue
+        field, position = target
+        rule = list(rules.get(field, UNCONSTRAINED_RULE))
+        rule[position] = _weight_list(field, value) if position == 2 else _name_list(field, value)
+        rules[field] = tuple(rule)
+    if not rules:
+        return None
+    try:
+        return compile_constraints(tuple((field, rules.get(field, UNCONSTRAINED_RULE)) for field in CHOICE_FIELDS))
+    except ValueError as error:
+        abort(400, description=str(error))
+
+PDF_RETRY_AFTER = int(os.environ.get("PDF_RETRY_AFTER", "2"))
+ROSTER_RETRY_AFTER = int(os.environ.get("ROSTER_RETRY_AFTER", "2"))
+
+REQUEST_SECONDS = metrics.Histogram(
+    "dnd_http_request_duration_seconds", "Time spent handling a request, by route",
+    ("endpoint", "method", "status"))
+STAGE_SECONDS = metrics.Histogram(
+    "dnd_stage_duration_seconds", "Time spent in each stage of character generation and PDF rendering",
+    ("stage",))
+metrics.Gauge("dnd_pdf_pool_in_flight", "PDF renders running or queued in the process pool",
+              lambda: render_pool.stats()["in_flight"])
+metrics.CounterFunc("dnd_pdf_pool_rejected_total", "PDF renders refused because the queue was full",
+                    lambda: render_pool.stats()["rejected"])
+metrics.CounterFunc("dnd_pdf_cache_hits_total", "PDF sheets served from the in-memory cache",
+                    lambda: pdf_cache.stats()["hits"])
+metrics.CounterFunc("dnd_pdf_cache_disk_hits_total", "PDF sheets served from the on-disk cache",
+                    lambda: pdf_cache.stats()["disk_hits"])
+metrics.CounterFunc("dnd_pdf_cache_misses_total", "PDF sheets that had to be rendered",
+                    lambda: pdf_cache.stats()["misses"])
+metrics.CounterFunc("dnd_pdf_cache_evictions_total", "PDF sheets dropped from memory to stay under PDF_CACHE_BYTES",
+                    lambda: pdf_cache.stats()["evictions"])
+metrics.Gauge("dnd_pdf_cache_bytes", "Bytes of PDF held in the in-memory cache",
+              lambda: pdf_cache.stats()["bytes"])
+metrics.CounterFunc("dnd_admission_rejected_total", "Requests refused by rate or concurrency limits",
+                    admission.rejections, ("group", "reason"))
+metrics.Gauge("dnd_admission_in_flight", "Requests being handled, by endpoint group",
+              admission.in_flight, ("group",))
+metrics.Gauge("dnd_mail_queue_depth", "Contact messages waiting to be sent or retried in this process",
+              mail_queue.depth)
+metrics.CounterFunc("dnd_mail_messages_total", "Contact messages by outcome",
+                    lambda: {(outcome,): count for outcome, count in mail_queue.stats().items()
+                             if outcome in ("queued", "sent", "retried", "failed", "rejected")},
+                    ("outcome",))
+metrics.Gauge("dnd_roster_queue_depth", "Characters waiting to be committed to the roster in this process",
+              roster.depth)
+metrics.CounterFunc("dnd_roster_characters_total", "Characters saved to the roster by outcome",
+                    lambda: {(outcome,): count for outcome, count in roster.stats().items() if outcome != "pending"},
+                    ("outcome",))
+metrics.CounterFunc("dnd_prefetch_requests_total",
+                    "Plain /generate requests answered from the prefetch buffer (hit) or built inline (miss)",
+                    lambda: {("hit",): prefetched.stats()["hits"], ("miss",): prefetched.stats()["misses"]},
+                    ("result",))
+metrics.Gauge("dnd_prefetch_buffered", "Characters ready in this process's prefetch buffers",
+              lambda: prefetched.stats()["buffered"])
+if isinstance(admission.buckets, admission.LocalBuckets):
+    metrics.Gauge("dnd_rate_limiter_clients", "Clients with a token bucket in this process",
+                  lambda: len(admission.buckets))
+
+# Endpoint -> admission group; a shared sheet downloaded as a PDF counts as "pdf"
+ADMISSION_GROUPS = {
+    "generate_character": "generate",
+    "generate_batch": "generate",
+    "shared_character": "generate",
+    "download_pdf": "pdf",
+    "download_pdf_bulk": "pdf",
+    "contact_submit": "contact",
+    "roster_list": "generate",
+    "roster_character": "generate",
+    "roster_save": "generate",
+    "roster_pdf": "pdf",
+}
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - start, (endpoint, request.method, str(response.status_code)))
+    metrics.flush()
+    return response
+
+@app.before_request
+def admit_request():
+    group = ADMISSION_GROUPS.get(request.endpoint)
+    if group is None:
+        return
+    if request.endpoint == "shared_character" and request.args.get("format") == "pdf":
+        group = "pdf"
+    admission.admit(group, request.remote_addr)
+    g.admission_group = group
+
+@app.teardown_request
+def release_admission(exc):
+    # Teardown runs after a streamed response has finished, so a long export holds its slot
+    group = g.pop("admission_group", None)
+    if group is not None:
+        admission.release(group)
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.errorhandler(400)
+def bad_request(error):
+    return jsonify({"error": error.description}), 400
+
+@app.errorhandler(413)
+def payload_too_large(error):
+    return jsonify({"error": f"request body is limited to {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+@app.errorhandler(admission.Rejected)
+def request_rejected(error):
+    if error.status == 429:
+        response = jsonify({"error": "too many requests, slow down"})
+    else:
+        response = jsonify({"error": "server is busy, try again shortly"})
+    response.headers["Retry-After"] = str(max(1, math.ceil(error.retry_after)))
+    return response, error.status
+
+@app.errorhandler(mail_queue.QueueFull)
+def mail_queue_full(error):
+    response = jsonify({"error": "too many messages waiting to be sent, try again later"})
+    response.headers["Retry-After"] = str(CONTACT_RETRY_AFTER)
+    return response, 503
+
+@app.errorhandler(roster.NotConfigured)
+def roster_not_configured(error):
+    return jsonify({"error": "saving characters is not set up on this server"}), 503
+
+@app.errorhandler(roster.QueueFull)
+def roster_queue_full(error):
+    response = jsonify({"error": "too many characters waiting to be saved, try again shortly"})
+    response.headers["Retry-After"] = str(ROSTER_RETRY_AFTER)
+    return response, 503
+
+@app.errorhandler(render_pool.PoolBusy)
+def pdf_pool_busy(error):
+    response = jsonify({"error": "PDF rendering is busy, try again shortly"})
+    response.headers["Retry-After"] = str(PDF_RETRY_AFTER)
+    return response, 503
+
+# The landing pages have no template variables, so they are rendered and compressed
+# once and served from memory. In debug mode a changed template file is re-rendered.
+PAGE_CACHE_CONTROL = os.environ.get("PAGE_CACHE_CONTROL", "public, max-age=300, must-revalidate")
+PAGE_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+_static_pages = {}
+
+def _template_mtime(template):
+    return os.stat(os.path.join(app.root_path, app.template_folder, template)).st_mtime_ns
+
+def _prerender_page(template):
+    mtime = _template_mtime(template)
+    with app.app_context():
+        body = render_template(template).encode("utf-8")
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    # Each encoding is a different byte sequence, so each gets its own strong ETag
+    variants = {"identity": (body, digest)}
+    variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), digest + "-gz")
+    if brotli is not None:
+        variants["br"] = (brotli.compress(body, quality=11), digest + "-br")
+    page = _static_pages[template] = (mtime, variants)
+    return page
+
+def _static_page(template):
+    page = _static_pages.get(template)
+    if page is None or (app.debug and page[0] != _template_mtime(template)):
+        page = _prerender_page(template)
+    variants = page[1]
+
+    encoding = "identity"
+    for candidate in PAGE_ENCODINGS:
+        if request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    body, etag = variants[encoding]
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="text/html")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = PAGE_CACHE_CONTROL
+    response.vary.add("Accept-Encoding")
+    return response
+
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return _static_page("index.html")
 
 @app.route('/contact')
 def contact():
-    return render_template('contact.html')
+    return _static_page('contact.html')
+
+CONTACT_TO = os.environ.get("CONTACT_TO", "panda@pandasdnd.cloud")
+MAIL_FROM = os.environ.get("MAIL_FROM", CONTACT_TO)
+CONTACT_RETRY_AFTER = int(os.environ.get("CONTACT_RETRY_AFTER", "60"))
+CONTACT_NAME_MAX_LENGTH = 100
+CONTACT_MESSAGE_MAX_LENGTH = 5000
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+@app.route("/contact", methods=["POST"])
+def contact_submit():
+    # Form posts and JSON both work. The message is queued for the background sender,
+    # so the response doesn't wait on the SMTP server.
+    if not mail_queue.configured():
+        return jsonify({"error": "the contact form is not set up, please use the email link"}), 503
+    fields = request.get_json(silent=True) if request.is_json else request.form
+    if not isinstance(fields, dict):
+        abort(400, description="expected a form or a JSON object")
+    name = str(fields.get("name") or "").strip()
+    email = str(fields.get("email") or "").strip()
+    message = str(fields.get("message") or "").strip()
+    if len(name) > CONTACT_NAME_MAX_LENGTH or "\r" in name or "\n" in name:
+        abort(400, description=f"name must be a single line of at most {CONTACT_NAME_MAX_LENGTH} characters")
+    if len(email) > 254 or not EMAIL_PATTERN.fullmatch(email):
+        abort(400, description="a valid email address is required")
+    if not message or len(message) > CONTACT_MESSAGE_MAX_LENGTH:
+        abort(400, description=f"message must be 1 to {CONTACT_MESSAGE_MAX_LENGTH} characters")
+
+    mail = MIMEText(message, "plain", "utf-8")
+    mail["Subject"] = f"Contact form: {name or email}"
+    mail["From"] = MAIL_FROM
+    mail["To"] = CONTACT_TO
+    mail["Reply-To"] = email
+    mail_queue.enqueue(mail)
+    return jsonify({"status": "queued"}), 202
+
+# With PREFETCH=1, a /generate with nothing but a level and one of the offered personal
+# items (what the UI's button sends) is answered from JSON built ahead of time
+PREFETCH_PARAMS = frozenset(("level", "personal_item"))
+
+def _prefetch_body(key):
+    level, personal_item = key
+    _stage_prefix.value = "prefetch"
+    return app.json.dumps(build_character(level, personal_item)) + "\n"
+
+prefetched = prefetch.PrefetchBuffers(_prefetch_body, enabled=prefetch.PREFETCH)
 
 @app.route("/generate")
 def generate_character():
-    level = int(request.args.get("level", 1))
-    personal_item = request.args.get("personal_item", "a mysterious token with a forgotten past")
-    race = random.choice(races)
-    char_class = random.choice(classes)
-    subclass = random.choice(subclasses[char_class])
-    gender = random.choice(genders)
-    background = random.choice(backgrounds)
-    theme = random.choice(themes)
-    appearance = generate_appearance(race, theme["name"])
-    stats = generate_stats(level)
-    con_score = stats.get("Constitution", 10)
-    con_mod = (con_score - 10) // 2        
-    first_names, last_names = load_race_name_pool(race)
-    full_name = f"{random.choice(first_names)} {random.choice(last_names)}"
-    backstory = generate_backstory(full_name, race, char_class, background, appearance, personal_item)
-
-    hd = hit_dice.get(char_class, 8)  # fallback to d8
-
-    # Level 1: Max die + CON mod
-    base_hp = hd + con_mod
-
-    # Each level after 1:
-    worst_hp = base_hp + (level - 1) * (1 + con_mod)
-    best_hp = base_hp + (level - 1) * (hd + con_mod)
-
-    # Prevent negatives
-    worst_hp = max(worst_hp, level)
-
-    hp_range = f"{worst_hp}–{best_hp}"
-    
-    #Generate max lvel preview (12)
-    max_level = 12
-    max_worst_hp = base_hp + (max_level -1) * (1 + con_mod)
-    max_best_hp = base_hp + (max_level -1) * (hd + con_mod)
-    max_worst_hp = max(max_worst_hp, max_level)
-    max_hp_range = f"{max_worst_hp}-{max_best_hp}"
-    max_stats = generate_stats(12)
-    max_con_score = max_stats.get("Constitution", 10)
-    max_con_mod = (max_con_score - 10) // 2
-
-
-    return jsonify({
+    level = _level_arg()
+    personal_item = _personal_item_arg()
+    if set(request.args) <= PREFETCH_PARAMS and personal_item in PERSONAL_ITEMS:
+        body = prefetched.pop((level, personal_item))
+        if body is not None:
+            return Response(body, mimetype="application/json")
+    save_to = _save_arg()
+    character = build_character(level, personal_item, _seed_arg(), constraints=_constraint_args(),
+                                stats_method=_stats_method_arg())
+    if save_to is not None:
+        roster.save([character], save_to)
+    with STAGE_SECONDS.time("generate.serialize"):
+        return jsonify(character)
+
+@app.route("/generate/status")
+def generate_status():
+    stats = prefetched.stats()
+    requests = stats["hits"] + stats["misses"]
+    return jsonify(dict(stats, enabled=prefetched.enabled, running=prefetched.running(), hit_rate=stats["hits"] / requests if requests else None))
+
+@app.route("/generate/batch")
+def generate_batch():
+    count = _int_arg("count", 1)
+    if count < 1 or count > BATCH_MAX_COUNT:
+        abort(400, description=f"count must be between 1 and {BATCH_MAX_COUNT}")
+    level = _level_arg()
+    personal_item = _personal_item_arg()
+    # A batch seed makes the whole batch reproducible; each character still gets its own code
+    batch_seed = _seed_arg()
+    seeder = random if batch_seed is None else random.Random(batch_seed)
+    # unique=1 gives every character a different appearance and backstory combination
+    combos = UniqueCombinations(seeder.getrandbits(64)) if _int_arg("unique", 0) else None
+    # unique_names=1 never repeats a full name within the batch
+    used_names = set() if _int_arg("unique_names", 0) else None
+    constraints = _constraint_args()
+    stats_method = _stats_method_arg()
+    save_to = _save_arg()
+    if save_to is not None:
+        # Room for the whole batch is checked up front; a stream can't turn into a 503 halfway
+        roster.check_capacity(count)
+
+    # One JSON document per line, produced lazily so memory stays flat for large counts
+    def stream():
+        remaining = count
+        while remaining:
+            seeds = [seeder.getrandbits(64) for _ in range(min(remaining, BATCH_CHUNK_SIZE))]
+            remaining -= len(seeds)
+            saved = []
+            for seed, rolls in zip(seeds, roll_character_stats(seeds, level, stats_method)):
+                character = build_character(level, personal_item, seed, rolls, combos=combos,
+                                            constraints=constraints, stats_method=stats_method,
+                                            used_names=used_names)
+                if save_to is not None:
+                    saved.append(character)
+                yield app.json.dumps(character) + "\n"
+            if saved:
+                roster.save(saved, save_to, check=False)
+
+    return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+@lru_cache(maxsize=None)
+def _stat_distribution(method):
+    return stat_distribution(method, MAX_LEVEL)
+
+@app.route("/stats/distribution")
+def stats_distribution():
+    # Exact per-ability probability tables for each stats_method, with the mean score per level
+    method = request.args.get("method")
+    if method is None:
+        return jsonify({"engine": STATS_ENGINE, "methods": [_stat_distribution(method) for method in STAT_METHODS]})
+    if method not in STAT_METHODS:
+        abort(400, description=f"method must be one of {', '.join(STAT_METHODS)}")
+    return jsonify(dict(_stat_distribution(method), engine=STATS_ENGINE))
+
+@app.route("/character/<code>")
+def shared_character(code):
+    seed, level, personal_item, combo, picks, stats_method, name_draw, stats_engine = decode_share_code(code)
+    character = build_character(level, personal_item, seed, combo=combo, picks=picks, stats_method=stats_method,
+                                name_draw=name_draw, stats_engine=stats_engine)
+    if request.args.get("format") == "pdf":
+        return _sheet_response(character)
+    return jsonify(character)
+
+# The prefetch thread builds characters too; its stages are recorded as "prefetch.*"
+# so they don't skew the request latencies under "generate.*"
+_stage_prefix = threading.local()
+
+def _stage(name):
+    return STAGE_SECONDS.time(f"{getattr(_stage_prefix, 'value', 'generate')}.{name}")
+
+def build_character(level, personal_item, seed=None, rolls=None, combo=None, combos=None,
+                    picks=None, constraints=None, stats_method=DEFAULT_STATS_METHOD, name_draw=0,
+                    used_names=None, stats_engine=STATS_ENGINE):
+    # Every choice comes from a per-character generator so the share code reproduces it exactly.
+    # A combination index (given directly, or drawn from a batch's UniqueCombinations) picks
+    # the appearance and backstory instead of the generator. Likewise the race, class,
+    # subclass, gender, background and theme can be given as picks, or sampled from
+    # ChoiceConstraints, in which case they don't consume the generator either. Markov
+    # names are a hash of the seed; a batch passes used_names to skip names it has
+    # already handed out, and the draw that got past them goes in the share code.
+    if seed is None:
+        seed = random.getrandbits(64)
+    if rolls is None:
+        with _stage("stats"):
+            [rolls] = roll_character_stats([seed], level, stats_method, stats_engine)
+    stats = rolls
+    with _stage("choices"):
+        rng = random.Random(seed)
+        if constraints is not None:
+            picks = constraints.sample(seed)
+        if picks is None:
+            race = rng.choice(races)
+            char_class = rng.choice(classes)
+            subclass = rng.choice(subclasses[char_class])
+            gender = rng.choice(genders)
+            background = rng.choice(backgrounds)
+            theme = rng.choice(themes)
+        else:
+            race, char_class, subclass, gender, background, theme = resolve_picks(picks)
+        if combos is not None:
+            combo = combos.next(race)
+        picker = rng if combo is None else MixedRadixChooser(combo)
+    with _stage("appearance"):
+        appearance = generate_appearance(race, theme["name"], picker)
+    with _stage("names"):
+        if NAME_GENERATOR == "markov":
+            names = name_pools.name_model()
+            if used_names is not None:
+                full_name, name_draw = names.unique_full_name(name_pools.key(race), seed, used_names)
+                used_names.add(full_name)
+            else:
+                full_name = names.full_name(name_pools.key(race), seed, name_draw)
+        else:
+            first_names, last_names = load_race_name_pool(race)
+            full_name = f"{rng.choice(first_names)} {rng.choice(last_names)}"
+            # Pool names come from the generator, so skipping a used name takes more of
+            # it; the number of extra picks goes in the share code to be replayed
+            if used_names is not None:
+                name_draw = 0
+                while full_name in used_names and name_draw < 255:
+                    full_name = f"{rng.choice(first_names)} {rng.choice(last_names)}"
+                    name_draw += 1
+                used_names.add(full_name)
+            else:
+                for _ in range(name_draw):
+                    full_name = f"{rng.choice(first_names)} {rng.choice(last_names)}"
+    with _stage("backstory"):
+        backstory = generate_backstory(full_name, race, char_class, background, appearance, personal_item, picker)
+
+    with _stage("progression"):
+        bonus = level_bonus(level)
+        base_con = stats["CON"] - bonus
+        progression = PROGRESSION_TABLES.get((char_class, base_con)) or PROGRESSION_TABLES[None, base_con]
+        _, hp_min, hp_max, _, _, _ = progression[level - 1]
+        _, preview_min, preview_max, _, _, _ = progression[PREVIEW_LEVEL - 1]
+        # Scores only change by the level bonus, so the preview needs no second roll
+        preview_shift = level_bonus(PREVIEW_LEVEL) - bonus
+        max_stats = {stat: score + preview_shift for stat, score in stats.items()}
+
+    return {
         "name": full_name,
         "race": race,
         "class": char_class,
@@ -526,88 +1098,268 @@ def generate_character():
         "level": level,
         "stats": stats,
         "max_stats": max_stats,
-        "hp_range": hp_range,
+        "hp_range": f"{hp_min}–{hp_max}",
         "max_level_preview": {
-            "level": max_level,
-            "hp_range": max_hp_range
+            "level": PREVIEW_LEVEL,
+            "hp_range": f"{preview_min}-{preview_max}"
         },
-        "con_mod": con_mod,
-        "max_con_mod":max_con_mod,
+        "con_mod": ability_modifier(stats["CON"]),
+        "max_con_mod": ability_modifier(max_stats["CON"]),
+        "progression": {"columns": PROGRESSION_COLUMNS, "rows": progression},
         "personal_item": personal_item,
-        "backstory": backstory
-    })  
+        "backstory": backstory,
+        # A string: JSON.parse rounds integers above 2**53, and seeds go up to 2**64
+        "seed": str(seed),
+        "code": encode_share_code(seed, level, personal_item, combo, picks, stats_method, name_draw, stats_engine)
+    }
     
 @app.route("/download_pdf", methods=["POST"])
 def download_pdf():
-    data = request.get_json()
-
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    margin_x = 50
-    y = height - 50
-    line_height = 14
-    section_spacing = 24
-    max_line_width = 90  # wrap long lines
-
-    def draw_wrapped(text, indent=0, bold=False):
-        nonlocal y
-        if not text:
-            y -= line_height
-            return
-        font_size = 14 if bold else 12
-        font = "Helvetica-Bold" if bold else "Helvetica"
-        c.setFont(font, font_size)
-        lines = wrap(text, width=max_line_width)
-        for line in lines:
-            if y < 60:
-                c.showPage()
-                y = height - 50
-            c.drawString(margin_x + indent, y, line)
-            y -= line_height
-
-    def draw_section(title, content, indent=0):
-        nonlocal y
-        draw_wrapped(title, bold=True)
-
-        if isinstance(content, list):
-            for item in content:
-                draw_wrapped(f"- {item}", indent=indent)
-
-        elif isinstance(content, str):
-            paragraphs = content.strip().split("\n")
-            for para in paragraphs:
-                wrapped = para.strip()
-                if wrapped:
-                    draw_wrapped(wrapped, indent=indent)
-
-        y -= section_spacing
-
-    # --- HEADER ---
-    draw_wrapped(data["name"], bold=True)
-    draw_wrapped(f"Race: {data['race']}")
-    draw_wrapped(f"Class: {data['class']} ({data['subclass']})")
-    draw_wrapped(f"Gender: {data['gender']}")
-    draw_wrapped(f"Background: {data['background']}")
-    draw_wrapped(f"Theme: {data['theme']['name']}")
-    draw_wrapped(f"Personal Item: {data['personal_item']}")
-    y -= section_spacing
-
-    # --- STATS ---
-    stat_lines = [f"{stat}: {val}" for stat, val in data["stats"].items()]
-    draw_section("Stats:", stat_lines, indent=20)
-
-    # --- Appearance ---
-    draw_section("Appearance:", data["appearance"], indent=20)
-
-    # --- Backstory ---
-    draw_section("Backstory:", data["backstory"], indent=20)
-
-    c.save()
-    buffer.seek(0)
-
-    return send_file(buffer, as_attachment=True, download_name="character_sheet.pdf", mimetype='application/pdf')
+    with STAGE_SECONDS.time("pdf.parse"):
+        data = request.get_json()
+        _validate_sheet(data)
+    return _sheet_response(data)
+
+def _render_sheet(character):
+    # Layout and save are timed inside the pool worker; the rest of the round trip is queueing
+    start = time.perf_counter()
+    pdf, layout_seconds, save_seconds = render_pool.submit(render_sheet_with_timings, character).result()
+    STAGE_SECONDS.observe(layout_seconds, ("pdf.layout",))
+    STAGE_SECONDS.observe(save_seconds, ("pdf.save",))
+    STAGE_SECONDS.observe(max(time.perf_counter() - start - layout_seconds - save_seconds, 0.0), ("pdf.queue",))
+    return pdf
+
+def _sheet_response(character):
+    # Sheets are cached by a hash of what they draw, which also makes a strong ETag;
+    # send_file answers a matching conditional GET with 304
+    key = pdf_cache.key_for(character)
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        pdf = _render_sheet(character)
+        pdf_cache.put(key, pdf)
+    return send_file(BytesIO(pdf), as_attachment=True, download_name="character_sheet.pdf",
+                     mimetype='application/pdf', etag=key, conditional=True)
+
+@app.route("/download_pdf/status")
+def download_pdf_status():
+    return jsonify(dict(render_pool.stats(), cache=pdf_cache.stats()))
+
+BULK_MAX_SHEETS = int(os.environ.get("BULK_MAX_SHEETS", "500"))
+
+def _bulk_characters(payload):
+    # Returns (count, iterable of character dicts). Everything is validated before the
+    # response starts, but generated characters are only built as the stream asks for them.
+    if "characters" in payload:
+        characters = payload["characters"]
+        if not isinstance(characters, list):
+            abort(400, description="characters must be a list of character objects")
+        for character in characters:
+            _validate_sheet(character)
+        return len(characters), iter(characters)
+    if "codes" in payload:
+        codes = payload["codes"]
+        if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+            abort(400, description="codes must be a list of character codes")
+        decoded = [decode_share_code(code) for code in codes]
+        return len(decoded), (build_character(level, item, seed, combo=combo, picks=picks, stats_method=method,
+                                              name_draw=name_draw, stats_engine=engine)
+                              for seed, level, item, combo, picks, method, name_draw, engine in decoded)
+    if "ids" in payload:
+        # Characters saved in the roster
+        ids = payload["ids"]
+        if not isinstance(ids, list) or not all(isinstance(character_id, int) for character_id in ids):
+            abort(400, description="ids must be a list of roster ids")
+        if len(ids) > BULK_MAX_SHEETS:
+            abort(400, description=f"at most {BULK_MAX_SHEETS} sheets per export")
+        saved = roster.get_characters(ids)
+        for character_id in ids:
+            if character_id not in saved:
+                abort(400, description=f"no saved character with id {character_id}")
+        return len(ids), (saved[character_id]["character"] for character_id in ids)
+    if "count" in payload:
+        count, level, seed = payload["count"], payload.get("level", 1), payload.get("seed")
+        personal_item = payload.get("personal_item", DEFAULT_PERSONAL_ITEM)
+        if not isinstance(count, int) or count < 1:
+            abort(400, description="count must be a positive integer")
+        if not isinstance(level, int) or not 1 <= level <= MAX_LEVEL:
+            abort(400, description=f"level must be between 1 and {MAX_LEVEL}")
+        if not isinstance(personal_item, str) or len(personal_item) > MAX_PERSONAL_ITEM_LENGTH:
+            abort(400, description=f"personal_item must be a string of at most {MAX_PERSONAL_ITEM_LENGTH} characters")
+        if seed is not None and not isinstance(seed, int):
+            abort(400, description="seed must be an integer")
+        stats_method = payload.get("stats_method", DEFAULT_STATS_METHOD)
+        if stats_method not in STAT_METHODS:
+            abort(400, description=f"stats_method must be one of {', '.join(STAT_METHODS)}")
+        seeder = random if seed is None else random.Random(seed)
+        combos = UniqueCombinations(seeder.getrandbits(64)) if payload.get("unique") else None
+        used_names = set() if payload.get("unique_names") else None
+        return count, (build_character(level, personal_item, seeder.getrandbits(64), combos=combos,
+                                       stats_method=stats_method, used_names=used_names)
+                       for _ in range(count))
+    abort(400, description="expected one of characters, codes, ids or count")
+
+def _sheet_filename(index, character):
+    name = re.sub(r"[^A-Za-z0-9]+", "_", str(character["name"])).strip("_") or "character"
+    return f"{index:03d}_{name}.pdf"
+
+def _stream_zip(characters):
+    # Sheets render on the process pool; each finished PDF is written into the archive
+    # and flushed to the client before the next one is awaited
+    sink = _ZipSink()
+    pending_names = deque()
+
+    def named(characters):
+        for index, character in enumerate(characters, 1):
+            pending_names.append(_sheet_filename(index, character))
+            yield character
+
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for pdf in render_pool.map_ordered(render_sheet_bytes, named(characters)):
+            archive.writestr(pending_names.popleft(), pdf)
+            yield sink.drain()
+    yield sink.drain()
+
+class _ZipSink:
+    # Write-only, non-seekable file object; zipfile falls back to data descriptors
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+@app.route("/download_pdf/bulk", methods=["POST"])
+def download_pdf_bulk():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        abort(400, description="expected a JSON object")
+    count, characters = _bulk_characters(payload)
+    if count > BULK_MAX_SHEETS:
+        abort(400, description=f"at most {BULK_MAX_SHEETS} sheets per export")
+    export_format = payload.get("format", "zip")
+    if export_format == "pdf":
+        # One document can't be split across processes without merging, so the whole
+        # export is a single pool task
+        pdf = render_pool.submit(render_sheets_pdf, list(characters)).result()
+        return send_file(BytesIO(pdf), as_attachment=True, download_name="characters.pdf", mimetype='application/pdf')
+    if export_format == "zip":
+        render_pool.check_capacity()
+        return Response(stream_with_context(_stream_zip(characters)), mimetype="application/zip",
+                        headers={"Content-Disposition": 'attachment; filename="characters.zip"'})
+    abort(400, description="format must be 'pdf' or 'zip'")
+
+ROSTER_PAGE_SIZE = 50
+ROSTER_PAGE_MAX = 500
+
+def _timestamp_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        timestamp = float(value)
+    except ValueError:
+        timestamp = math.nan
+    if not math.isfinite(timestamp):
+        abort(400, description=f"{name} must be a Unix timestamp")
+    return timestamp
+
+@app.route("/roster")
+def roster_list():
+    # Saved characters, newest first, filtered by ?roster=, ?race=, ?class=, ?level=,
+    # ?since= and ?until= (Unix timestamps). The response's "next" is passed back as
+    # ?before= for the following page.
+    filters = {"roster": request.args.get("roster")}
+    for field in ("race", "class"):
+        value = request.args.get(field)
+        if value is not None:
+            filters[field] = _canonical_names(field).get(value.strip().lower(), value)
+    if "level" in request.args:
+        filters["level"] = _level_arg()
+    limit = _int_arg("limit", ROSTER_PAGE_SIZE)
+    if not 1 <= limit <= ROSTER_PAGE_MAX:
+        abort(400, description=f"limit must be between 1 and {ROSTER_PAGE_MAX}")
+    entries, next_before = roster.list_characters(filters, _timestamp_arg("since"), _timestamp_arg("until"),
+                                                  _int_arg("before"), limit)
+    return jsonify({"characters": entries, "next": next_before})
+
+def _saved_character(character_id):
+    entry = roster.get_character(character_id)
+    if entry is None:
+        abort(404)
+    return entry
+
+@app.route("/roster/<int:character_id>")
+def roster_character(character_id):
+    return jsonify(_saved_character(character_id))
+
+@app.route("/roster/<int:character_id>/pdf")
+def roster_pdf(character_id):
+    # Drawn straight from the stored sheet fields; nothing is regenerated
+    return _sheet_response(_saved_character(character_id)["character"])
+
+@app.route("/roster", methods=["POST"])
+def roster_save():
+    # Takes the same characters, codes or count as /download_pdf/bulk, plus an optional
+    # "roster" name. Accepted characters are committed in the background.
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        abort(400, description="expected a JSON object")
+    name = _roster_name(payload.get("roster"))
+    count, characters = _bulk_characters(payload)
+    if count > BATCH_MAX_COUNT:
+        abort(400, description=f"at most {BATCH_MAX_COUNT} characters per save")
+    roster.check_capacity(count)
+    characters = list(characters)
+    for character in characters:
+        level = character.get("level")
+        if not isinstance(level, int) or not 1 <= level <= MAX_LEVEL:
+            abort(400, description=f"level must be between 1 and {MAX_LEVEL}")
+        code = character.get("code")
+        if code is not None and (not isinstance(code, str) or len(code) > SHEET_FIELD_MAX_LENGTH):
+            abort(400, description="code is not valid or too long")
+    roster.save(characters, name, check=False)
+    return jsonify({"status": "queued", "count": len(characters)}), 202
+
+# When the PDF side gets ready. "startup" renders a sheet before serving (with
+# preload_app, once in the gunicorn master, so workers share reportlab copy-on-write).
+# "background" serves /generate straight away and loads reportlab and starts the
+# render pool from a thread in each worker, for the fastest cold start. "off" leaves
+# it all to the first PDF request.
+PDF_WARM_UP = os.environ.get("PDF_WARM_UP", "startup")
+
+def _warm_up_pdf(character, start_pdf_pool):
+    render_sheet_bytes(character)
+    if start_pdf_pool:
+        render_pool.submit(render_sheet_bytes, character).result()
+
+def warm_up(start_pdf_pool=False):
+    # Run each hot path once so the first real request doesn't pay for lazy setup
+    # (Flask's URL map and JSON provider, the name model, reportlab font metrics, the
+    # text width cache). start_pdf_pool is set when called in a gunicorn worker.
+    with app.test_client() as client:
+        # Its own rate-limit bucket, so warming up never spends a real local client's tokens
+        client.environ_base["REMOTE_ADDR"] = "warm-up"
+        # A seed keeps this off the prefetch path, so no refill thread is started in
+        # the gunicorn master (it starts on a worker's first plain /generate)
+        client.get("/generate?seed=0")
+        client.get("/")
+        client.get("/contact")
+    character = build_character(1, DEFAULT_PERSONAL_ITEM, 0)
+    if PDF_WARM_UP == "startup":
+        _warm_up_pdf(character, start_pdf_pool)
+    elif PDF_WARM_UP == "background" and start_pdf_pool:
+        # Only ever from a worker: a thread still importing in the master when gunicorn
+        # forks would leave the children with its import locks held
+        threading.Thread(target=_warm_up_pdf, args=(character, True), name="pdf-warm-up", daemon=True).start()
+    metrics.reset()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BackgroundQueue:
+    # Work handed to one background thread per process (threads don't survive
+    # gunicorn's fork, so a new one starts on first use after it). Subclasses set up
+    # per-thread state in reset() and loop in run(), calling get() for work and done()
+    # once an item is finished with. `pending` counts items from put() to done(), and
+    # put() refuses more than `maxsize` of them. Counters are kept for stats().
+    full_error = QueueFull
+
+    def __init__(self, name, maxsize, counters=()):
+        self.name = name
+        self.maxsize = maxsize
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_pid = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(("queued", "rejected", *counters, "pending"), 0)
+        atexit.register(self.drain)
+
+    def reset(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+    def _main(self):
+        self.reset()
+        self.run()
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._main, name=self.name, daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def depth(self):
+        with self._stats_lock:
+            return self._stats["pending"]
+
+    def check_capacity(self, count=1):
+        with self._stats_lock:
+            full = self._stats["pending"] + count > self.maxsize
+            if full:
+                self._stats["rejected"] += count
+        if full:
+            raise self.full_error()
+
+    def put(self, item, count=1, check=True):
+        # Returns straight away. check=False is for the rest of a stream that already
+        # called check_capacity for all of it.
+        if check:
+            self.check_capacity(count)
+        self._ensure_thread()
+        with self._stats_lock:
+            self._stats["pending"] += count
+            self._stats["queued"] += count
+        self._queue.put(item)
+
+    def get(self, timeout=None):
+        # The next item; raises queue.Empty after `timeout` seconds (0 doesn't wait)
+        if timeout is not None and timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def done(self, count=1):
+        self.count("pending", -count)
+
+    def drain(self, timeout=5.0):
+        # Give queued work a chance to finish when the process exits
+        deadline = time.monotonic() + timeout
+        while self.depth() and time.monotonic() < deadline and self._thread_pid == os.getpid():
+            time.sleep(0.05)
@@ -0,0 +1,41 @@
+# Per-call cost of generate_appearance for every race.
+#
+#   python benchmarks/bench_appearance.py                   # current tree
+#   python benchmarks/bench_appearance.py --app-dir ../old  # another checkout, for before/after
+import argparse
+import random
+import timeit
+
+from common import APP_DIR, load_application
+
+
+def time_race(application, race, number, repeat):
+    rng = random.Random(0)
+    try:
+        call = lambda: application.generate_appearance(race, "Arcane Whispers", rng)
+        call()
+    except TypeError:
+        call = lambda: application.generate_appearance(race, "Arcane Whispers")
+    best = min(timeit.repeat(call, number=number, repeat=repeat))
+    return best / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--number", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    application = load_application(args.app_dir)
+    results = {race: time_race(application, race, args.number, args.repeat)
+               for race in application.races}
+    for race, usec in sorted(results.items(), key=lambda item: item[1]):
+        print(f"{race:<20} {usec:8.3f} us/call")
+    fastest = min(results, key=results.get)
+    slowest = max(results, key=results.get)
+    print(f"\nfastest: {fastest} {results[fastest]:.3f} us, slowest: {slowest} {results[slowest]:.3f} us")
+
+
+if __name__ == "__main__":
+    main()
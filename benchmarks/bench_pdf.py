@@ -0,0 +1,66 @@
+# PDFs/sec for /download_pdf on a representative character, plus one with a very
+# long backstory. Goes through Flask's test client so any checkout can be timed.
+#
+#   python benchmarks/bench_pdf.py                   # current tree
+#   python benchmarks/bench_pdf.py --app-dir ../old  # another checkout, for before/after
+import argparse
+import os
+import time
+
+from common import APP_DIR, load_application
+
+# Rate limits would answer most of these back-to-back requests with 429s; they are
+# read when the app is imported, so this has to come first
+os.environ.setdefault("RATE_LIMIT_GENERATE", "0")
+os.environ.setdefault("RATE_LIMIT_PDF", "0")
+# The same payload is posted every time; with the sheet cache on only hits are timed
+os.environ.setdefault("PDF_CACHE_BYTES", "0")
+
+CHARACTER = {
+    "name": "Thalor Moonwhisper",
+    "race": "Elf",
+    "class": "Wizard",
+    "subclass": "Illusion",
+    "gender": "Non-binary",
+    "background": "Hermit",
+    "theme": {"name": "Arcane Whispers", "colors": ["#6A5ACD", "#8A2BE2", "#4B0082"]},
+    "personal_item": "a weathered book of ancient prayers",
+    "level": 5,
+    "stats": {"STR": 10, "DEX": 15, "CON": 13, "INT": 19, "WIS": 14, "CHA": 11},
+    "appearance": "has moonlight-pale skin, stormy blue eyes full of memory, braided platinum hair, "
+                  "and wears a flowing robe stitched with constellations reflecting the Arcane Whispers theme.",
+    "backstory": "Among the Elf, it's rare to find a Wizard. Rarer still is one as driven as Thalor "
+                 "Moonwhisper. Once a hermit, they endured trials in a cursed forest. Their appearance has "
+                 "moonlight-pale skin, stormy blue eyes full of memory, braided platinum hair, and wears a "
+                 "flowing robe stitched with constellations reflecting the Arcane Whispers theme marks them "
+                 "as someone unforgettable. They carry a weathered book of ancient prayers. This character "
+                 "wants to uncover a forbidden truth and talks to their weapon as if it were alive.",
+}
+# As long as SHEET_TEXT_MAX_LENGTH (4000) lets a posted backstory be
+LONG_CHARACTER = dict(CHARACTER, backstory=" ".join([CHARACTER["backstory"]] * 7))
+
+
+def pdfs_per_second(client, payload, seconds):
+    client.post("/download_pdf", json=payload)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        response = client.post("/download_pdf", json=payload)
+        assert response.status_code == 200, response.status_code
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    client = load_application(args.app_dir).app.test_client()
+    for label, payload in (("representative", CHARACTER), ("long backstory", LONG_CHARACTER)):
+        print(f"{label:<16} {pdfs_per_second(client, payload, args.seconds):8.1f} PDFs/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Roster listing cost on a large table: the first page, a page deep into the table,
+# filtered pages, and the same deep page fetched with OFFSET for comparison. The
+# table is filled with synthetic rows straight through SQLite, so a million takes
+# seconds rather than a million generated characters.
+#
+#   python benchmarks/bench_roster.py                       # 1,000,000 rows in a temp file
+#   python benchmarks/bench_roster.py --rows 5000000 --db /tmp/roster.db
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from common import APP_DIR, measure
+
+RACES = ("Dragonborn", "Dwarf", "Elf", "Gnome", "Half-Elf", "Half-Orc", "Halfling", "Human", "Tiefling", "Orc")
+CLASSES = ("Fighter", "Wizard", "Rogue", "Cleric", "Ranger", "Paladin", "Bard")
+
+
+def fill(roster, rows, chunk=50_000):
+    connection = roster._connect()
+    existing = connection.execute("SELECT count(*) FROM characters").fetchone()[0]
+    rng = random.Random(0)
+    sheet = json.dumps({"name": "Arin Ironwood", "backstory": "x" * 400})
+    created = time.time() - rows
+    for start in range(existing, rows, chunk):
+        batch = []
+        for index in range(start, min(start + chunk, rows)):
+            batch.append((created + index, rng.choice(("", "party", "villains")), rng.choice(RACES),
+                          rng.choice(CLASSES), rng.randint(1, 20), "Arin Ironwood", None, sheet))
+        connection.execute("BEGIN IMMEDIATE")
+        connection.executemany(roster.INSERT, batch)
+        connection.execute("COMMIT")
+    return connection, created
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", help="reuse (and top up) this file instead of a temp one")
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    # A temp database is deleted when the run ends
+    scratch = None if args.db else tempfile.TemporaryDirectory(prefix="dnd-roster-")
+    os.environ["ROSTER_DB"] = args.db or os.path.join(scratch.name, "roster.db")
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    import roster
+
+    start = time.perf_counter()
+    connection, created = fill(roster, args.rows)
+    print(f"{args.rows} rows ready in {time.perf_counter() - start:.1f}s ({os.environ['ROSTER_DB']})")
+
+    deep = args.rows // 10
+    cases = {
+        "first page": lambda: roster.list_characters({}),
+        "deep page (before=)": lambda: roster.list_characters({}, before=deep),
+        "race, deep page": lambda: roster.list_characters({"race": "Elf"}, before=deep),
+        "race+class+level, deep": lambda: roster.list_characters(
+            {"race": "Elf", "class": "Bard", "level": 7}, before=deep),
+        "since/until window": lambda: roster.list_characters(
+            {}, since=created + deep, until=created + deep + 1000),
+        "deep page (OFFSET)": lambda: connection.execute(
+            f"{roster.SELECT} ORDER BY id DESC LIMIT 50 OFFSET {args.rows - deep}").fetchall(),
+    }
+    print(f"\n{'case':<26} {'p50 ms':>9} {'p95 ms':>9}")
+    for label, fn in cases.items():
+        result = measure(fn, seconds=args.seconds, warmup=1)
+        print(f"{label:<26} {result['p50_us'] / 1e3:9.3f} {result['p95_us'] / 1e3:9.3f}")
+    connection.close()
+    if scratch is not None:
+        scratch.cleanup()
+
+
+if __name__ == "__main__":
+    main()
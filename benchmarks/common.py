@@ -0,0 +1,47 @@
+import contextlib
+import io
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def load_application(app_dir=APP_DIR):
+    sys.path.insert(0, os.path.abspath(app_dir))
+    # Older revisions print at import time
+    with contextlib.redirect_stdout(io.StringIO()):
+        import application
+    return application
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+def measure(fn, seconds=1.0, inner=1, warmup=3):
+    # Calls fn in groups of `inner` until `seconds` have passed. Each group is one
+    # latency sample (divided by `inner`), so sub-microsecond functions can be
+    # timed without the clock dominating.
+    for _ in range(warmup):
+        fn()
+    samples = []
+    clock = time.perf_counter
+    start = clock()
+    while clock() - start < seconds:
+        t0 = clock()
+        for _ in range(inner):
+            fn()
+        samples.append((clock() - t0) / inner)
+    elapsed = clock() - start
+    samples.sort()
+    return {
+        "ops": len(samples) * inner,
+        "ops_per_sec": len(samples) * inner / elapsed,
+        "p50_us": percentile(samples, 0.50) * 1e6,
+        "p95_us": percentile(samples, 0.95) * 1e6,
+        "p99_us": percentile(samples, 0.99) * 1e6,
+    }
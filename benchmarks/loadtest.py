@@ -0,0 +1,292 @@
+# End-to-end load test: starts gunicorn the way the Procfile does, drives it with a
+# weighted mix of real requests from concurrent asyncio clients, and reports
+# throughput, latency percentiles and error rates per endpoint.
+#
+#   python benchmarks/loadtest.py                                     # 1 sync worker, 30 s
+#   python benchmarks/loadtest.py --workers 1 2 4 --worker-class sync gthread --threads 4
+#   python benchmarks/loadtest.py --concurrency 32 --duration 60 --output load.json
+#   python benchmarks/loadtest.py --env PDF_CACHE_BYTES=0 --env PDF_WORKERS=2
+#
+# Every combination of --workers and --worker-class is run in turn against a fresh
+# server. Only the standard library is needed on the client side; everything stays
+# on 127.0.0.1.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import APP_DIR, percentile
+
+# name -> (weight, method, path); the PDF body is filled in from --pdf-characters
+DEFAULT_MIX = {
+    "/": (3, "GET", "/"),
+    "/generate": (6, "GET", "/generate?level=5"),
+    "/generate constrained": (1, "GET", "/generate?level=5&race=Elf&class=Wizard"),
+    "/generate/batch": (1, "GET", "/generate/batch?count=50"),
+    "/download_pdf": (2, "POST", "/download_pdf"),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app_dir, port, workers, worker_class, threads, extra_env):
+    # gunicorn quietly turns sync workers with threads into gthread ones
+    if worker_class != "gthread":
+        threads = 1
+    env = dict(os.environ, **extra_env)
+    # Keep the metrics files of one run away from the next; stop_server deletes them
+    metrics_dir = None
+    if "METRICS_DIR" not in env:
+        metrics_dir = tempfile.TemporaryDirectory(prefix="dnd-loadtest-metrics-")
+        env["METRICS_DIR"] = metrics_dir.name
+    # Every client comes from 127.0.0.1, so per-client rate limits would only measure
+    # themselves; pass --env RATE_LIMIT_GENERATE=... to test them deliberately
+    env.setdefault("RATE_LIMIT_GENERATE", "0")
+    env.setdefault("RATE_LIMIT_PDF", "0")
+    # The app sizes its concurrency limits from this; --threads alone doesn't reach it
+    env["GUNICORN_THREADS"] = str(threads)
+    command = [
+        sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py",
+        "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--worker-class", worker_class,
+        "--threads", str(threads), "--log-level", "warning", "application:application",
+    ]
+    server = subprocess.Popen(command, cwd=app_dir, env=env)
+    server.metrics_dir = metrics_dir
+    return server
+
+
+def wait_until_ready(port, server, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            status, _ = asyncio.run(request(port, "GET", "/"))
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+    if server.metrics_dir is not None:
+        server.metrics_dir.cleanup()
+
+
+async def request(port, method, path, body=None):
+    # One HTTP/1.1 request per connection, read to EOF; works the same against
+    # every worker class, including sync workers that never keep connections alive
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        head = f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        writer.write(head.encode("ascii") + b"\r\n" + (body or b""))
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    status_line = response.split(b"\r\n", 1)[0].split()
+    if len(status_line) < 2:
+        raise ConnectionError("empty response")
+    return int(status_line[1]), len(response)
+
+
+def fetch_characters(port, count):
+    # Real characters to post to /download_pdf, so the PDF cache sees a realistic spread
+    async def fetch():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET /generate/batch?count={count} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                     "Connection: close\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    head, _, body = asyncio.run(fetch()).partition(b"\r\n\r\n")
+    if b"transfer-encoding: chunked" in head.lower():
+        body = dechunk(body)
+    return [json.dumps(json.loads(line)).encode("utf-8") for line in body.splitlines() if line.startswith(b"{")]
+
+
+def dechunk(body):
+    out = bytearray()
+    while body:
+        size_line, _, rest = body.partition(b"\r\n")
+        size = int(size_line.split(b";")[0], 16)
+        if size == 0:
+            break
+        out += rest[:size]
+        body = rest[size + 2:]
+    return bytes(out)
+
+
+async def drive(port, mix, characters, concurrency, duration, warmup, seed):
+    names = list(mix)
+    weights = [mix[name][0] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    statuses = {name: {} for name in names}
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    measure_from = loop.time() + warmup
+    stop_at = measure_from + duration
+
+    async def client():
+        while loop.time() < stop_at:
+            name = rng.choices(names, weights)[0]
+            _, method, path = mix[name]
+            body = rng.choice(characters) if method == "POST" else None
+            start = loop.time()
+            try:
+                status, _ = await request(port, method, path, body)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                status = None
+            elapsed = loop.time() - start
+            if start < measure_from:
+                continue
+            key = str(status)
+            statuses[name][key] = statuses[name].get(key, 0) + 1
+            if status is None or status >= 400:
+                errors[name] += 1
+            else:
+                samples[name].append(elapsed)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, errors, statuses
+
+
+def summarize(samples, errors, statuses, duration):
+    results = {}
+    all_latencies = []
+    for name, latencies in samples.items():
+        latencies.sort()
+        all_latencies.extend(latencies)
+        results[name] = summary_row(latencies, errors[name], duration, statuses[name])
+    all_latencies.sort()
+    merged_statuses = {}
+    for counts in statuses.values():
+        for status, count in counts.items():
+            merged_statuses[status] = merged_statuses.get(status, 0) + count
+    results["total"] = summary_row(all_latencies, sum(errors.values()), duration, merged_statuses)
+    return results
+
+
+def summary_row(latencies, error_count, duration, statuses):
+    requests = len(latencies) + error_count
+    return {
+        "requests": requests,
+        "requests_per_sec": len(latencies) / duration,
+        "error_rate": error_count / requests if requests else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "statuses": statuses,
+    }
+
+
+def print_table(label, results):
+    print(f"\n{label}")
+    print(f"{'endpoint':<24} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in results.items():
+        print(f"{name:<24} {row['requests']:>9} {row['requests_per_sec']:>9.1f} {row['error_rate']:>7.1%} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--env expects KEY=VALUE, got {pair!r}")
+        env[key] = value
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--worker-class", nargs="+", default=["sync"],
+                        help="sync, gthread or gevent (gevent must be installed)")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gthread worker")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds per configuration")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each run")
+    parser.add_argument("--pdf-characters", type=int, default=200,
+                        help="distinct characters posted to /download_pdf")
+    parser.add_argument("--mix", help='JSON {"name": [weight, "GET", "/path"], ...} replacing the default mix')
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE for the server, repeatable")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    mix = {name: tuple(spec) for name, spec in json.loads(args.mix).items()} if args.mix else DEFAULT_MIX
+    extra_env = parse_env(args.env)
+    runs = []
+    for workers, worker_class in itertools.product(args.workers, args.worker_class):
+        label = f"{workers} x {worker_class}" + (f" ({args.threads} threads)" if worker_class == "gthread" else "")
+        port = free_port()
+        server = start_server(args.app_dir, port, workers, worker_class, args.threads, extra_env)
+        try:
+            wait_until_ready(port, server)
+            characters = fetch_characters(port, args.pdf_characters)
+            samples, errors, statuses = asyncio.run(drive(
+                port, mix, characters, args.concurrency, args.duration, args.warmup, args.seed))
+        finally:
+            stop_server(server)
+        results = summarize(samples, errors, statuses, args.duration)
+        print_table(label, results)
+        runs.append({
+            "workers": workers,
+            "worker_class": worker_class,
+            "threads": args.threads if worker_class == "gthread" else 1,
+            "results": results,
+        })
+
+    if len(runs) > 1:
+        print(f"\n{'configuration':<30} {'req/s':>9} {'errors':>7} {'p95 ms':>9} {'p99 ms':>9}")
+        for run in runs:
+            total = run["results"]["total"]
+            label = f"{run['workers']} x {run['worker_class']}"
+            print(f"{label:<30} {total['requests_per_sec']:>9.1f} {total['error_rate']:>7.1%} "
+                  f"{total['p95_ms']:>9.1f} {total['p99_ms']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "mix": mix,
+                "env": extra_env,
+                "runs": runs,
+            }, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Cold-start report: how long `import application` takes and which imports it goes
+# to, and how long a brand new process takes to answer its first /generate.
+#
+#   python benchmarks/startup.py                              # 5 fresh processes
+#   python benchmarks/startup.py --runs 10 --output startup.json
+#   python benchmarks/startup.py --baseline startup.json      # exit 1 on a regression
+#   python benchmarks/startup.py --gunicorn --env PDF_WARM_UP=background
+#
+# Every run is a new interpreter, so nothing is warm except the OS page cache and any
+# on-disk caches the app keeps (pass --env NAME_MODEL_CACHE_DIR= to time a first boot).
+# With --gunicorn the clock runs from spawning gunicorn (as the Procfile does) to the
+# first 200 from /generate.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from common import APP_DIR
+from loadtest import free_port, parse_env, request, start_server, stop_server
+
+# Run in the child: times the import and the first request from inside the process
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import application
+imported = time.perf_counter()
+client = application.app.test_client()
+status = client.get("/generate").status_code
+answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1e3,
+    "first_generate_ms": (answered - imported) * 1e3,
+    "status": status,
+    "pdf_modules_loaded": "reportlab.pdfgen.canvas" in sys.modules,
+}))
+"""
+
+
+def parse_importtime(stderr, module="application"):
+    # -X importtime lines are "import time: self | cumulative | <indent>name", children
+    # before their parent. Returns (self us, cumulative us, {direct import: cumulative us}).
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|")
+        self_us = int(head.split(":")[1])
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((depth, name.strip(), self_us, int(cumulative_us)))
+    for index, (depth, name, self_us, cumulative_us) in enumerate(entries):
+        if depth == 0 and name == module:
+            break
+    else:
+        raise RuntimeError(f"{module} does not appear in the import trace")
+    children = {}
+    for child_depth, child, _, child_cumulative in reversed(entries[:index]):
+        if child_depth == 0:
+            break
+        if child_depth == 1:
+            children[child] = child_cumulative
+    return self_us, cumulative_us, children
+
+
+def probe_once(app_dir, extra_env):
+    env = dict(os.environ, **extra_env)
+    env.setdefault("METRICS_DIR", "")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=app_dir, env=env,
+                            capture_output=True, text=True, check=True)
+    wall_ms = (time.perf_counter() - started) * 1e3
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    self_us, cumulative_us, children = parse_importtime(result.stderr)
+    sample.update(process_ms=wall_ms, application_self_ms=self_us / 1e3, imports_ms={
+        name: us / 1e3 for name, us in children.items()})
+    return sample
+
+
+def gunicorn_once(app_dir, extra_env, workers, worker_class, timeout=120.0):
+    # Spawn-to-first-200 for /generate, polling every 10 ms
+    port = free_port()
+    started = time.perf_counter()
+    server = start_server(app_dir, port, workers, worker_class, 1, extra_env)
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+            try:
+                status, _ = asyncio.run(request(port, "GET", "/generate"))
+                if status == 200:
+                    return (time.perf_counter() - started) * 1e3
+            except (OSError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("gunicorn did not answer /generate in time")
+    finally:
+        stop_server(server)
+
+
+def summarize(samples):
+    median = statistics.median
+    summary = {
+        "import_ms": median(s["import_ms"] for s in samples),
+        "first_generate_ms": median(s["first_generate_ms"] for s in samples),
+        "process_ms": median(s["process_ms"] for s in samples),
+        "application_self_ms": median(s["application_self_ms"] for s in samples),
+        "pdf_modules_loaded": any(s["pdf_modules_loaded"] for s in samples),
+        "imports_ms": {},
+    }
+    for name in samples[0]["imports_ms"]:
+        summary["imports_ms"][name] = median(s["imports_ms"].get(name, 0.0) for s in samples)
+    return summary
+
+
+def print_report(summary, gunicorn_ms=None, baseline=None, top=15):
+    def row(label, value, key=None):
+        line = f"{label:<40} {value:>10.1f}"
+        if baseline is not None and key is not None and baseline.get(key):
+            line += f" {value / baseline[key] - 1:>+9.1%}"
+        print(line)
+
+    print(f"\n{'median of fresh processes':<40} {'ms':>10}" + (f" {'vs base':>9}" if baseline else ""))
+    row("import application", summary["import_ms"], "import_ms")
+    row("  application.py itself", summary["application_self_ms"], "application_self_ms")
+    for name, ms in sorted(summary["imports_ms"].items(), key=lambda item: -item[1])[:top]:
+        row(f"  import {name}", ms)
+    row("first /generate after import", summary["first_generate_ms"], "first_generate_ms")
+    row("process start to first /generate", summary["process_ms"], "process_ms")
+    if gunicorn_ms is not None:
+        row("gunicorn spawn to first /generate", gunicorn_ms, "gunicorn_ms")
+    print(f"reportlab canvas loaded by /generate: {'yes' if summary['pdf_modules_loaded'] else 'no'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to take the median of")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE for the app, repeatable")
+    parser.add_argument("--gunicorn", action="store_true", help="also time a real gunicorn start")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--worker-class", default="sync")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.20)
+    args = parser.parse_args()
+
+    extra_env = parse_env(args.env)
+    samples = [probe_once(args.app_dir, extra_env) for _ in range(args.runs)]
+    summary = summarize(samples)
+    if args.gunicorn:
+        summary["gunicorn_ms"] = statistics.median(
+            gunicorn_once(args.app_dir, extra_env, args.workers, args.worker_class) for _ in range(args.runs))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["summary"]
+    print_report(summary, summary.get("gunicorn_ms"), baseline)
+
+    regressions = []
+    if baseline:
+        for key in ("import_ms", "first_generate_ms", "process_ms", "gunicorn_ms"):
+            if key in summary and baseline.get(key) and summary[key] > baseline[key] * (1 + args.tolerance):
+                regressions.append(key)
+        if summary["pdf_modules_loaded"] and not baseline.get("pdf_modules_loaded"):
+            regressions.append("pdf_modules_loaded")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "runs": args.runs,
+                "env": extra_env,
+                "summary": summary,
+                "samples": samples,
+            }, f, indent=2)
+            f.write("\n")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# Micro-benchmark suite for the generation and PDF hot paths.
+#
+#   python benchmarks/suite.py                                  # run everything, print a table
+#   python benchmarks/suite.py --output results.json            # save results
+#   python benchmarks/suite.py --baseline results.json          # compare against a saved run
+#   python benchmarks/suite.py --filter appearance --seconds 2  # subset, longer runs
+#
+# With --baseline the exit status is 1 if any benchmark's ops/sec dropped by more
+# than --tolerance (default 10%), so it can gate a change.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+from bench_pdf import CHARACTER, LONG_CHARACTER
+from common import APP_DIR, load_application, measure
+
+# Rate limits would answer most of these back-to-back requests with 429s; they are
+# read when the app is imported, so this has to come first
+os.environ.setdefault("RATE_LIMIT_GENERATE", "0")
+os.environ.setdefault("RATE_LIMIT_PDF", "0")
+# The same payload is posted every time; with the sheet cache on only hits are timed
+os.environ.setdefault("PDF_CACHE_BYTES", "0")
+
+
+def build_benchmarks(application):
+    client = application.app.test_client()
+    rng = random.Random(0)
+    appearance = application.generate_appearance("Elf", "Arcane Whispers")
+
+    # name -> (callable, inner loop size)
+    benchmarks = {
+        "http /generate": (lambda: client.get("/generate?level=5"), 1),
+        "http /download_pdf short": (lambda: client.post("/download_pdf", json=CHARACTER), 1),
+        "http /download_pdf long": (lambda: client.post("/download_pdf", json=LONG_CHARACTER), 1),
+        "generate_stats": (lambda: application.generate_stats(5), 20),
+        "generate_backstory": (lambda: application.generate_backstory(
+            "Thalor Moonwhisper", "Elf", "Wizard", "Hermit", appearance,
+            "a weathered book of ancient prayers"), 50),
+        "load_race_name_pool": (lambda: application.load_race_name_pool(rng.choice(application.races)), 50),
+    }
+    if hasattr(application, "STAT_METHODS"):
+        keys = list(range(1000))
+        for method in application.STAT_METHODS:
+            benchmarks[f"generate_stats[{method}]"] = (
+                lambda method=method: application.generate_stats(5, method=method), 20)
+        for engine in application.STAT_ENGINES:
+            benchmarks[f"roll_stats_batch 1k [{engine}]"] = (
+                lambda engine=engine: application.roll_stats_batch(keys, 5, engine=engine), 1)
+    if hasattr(application, "name_model"):
+        names = application.name_pools.name_model()
+        seeds = iter(range(1 << 62))
+        benchmarks["markov full_name"] = (
+            lambda: names.full_name(application.name_pools.key(rng.choice(application.races)), next(seeds)), 50)
+    for race in application.races:
+        benchmarks[f"generate_appearance[{race}]"] = (
+            lambda race=race: application.generate_appearance(race, "Arcane Whispers"), 100)
+    return benchmarks
+
+
+def run(benchmarks, seconds, pattern):
+    results = {}
+    for name, (fn, inner) in benchmarks.items():
+        if pattern and not re.search(pattern, name):
+            continue
+        # Older revisions print debug lines from the name loader
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = measure(fn, seconds=seconds, inner=inner)
+        print_row(name, results[name], file=sys.stderr)
+    return results
+
+
+def print_row(name, result, baseline=None, file=sys.stdout):
+    row = (f"{name:<40} {result['ops_per_sec']:>12,.1f} {result['p50_us']:>10.2f} "
+           f"{result['p95_us']:>10.2f} {result['p99_us']:>10.2f}")
+    if baseline is not None:
+        row += f" {result['ops_per_sec'] / baseline['ops_per_sec'] - 1:>+9.1%}"
+    print(row, file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--seconds", type=float, default=1.0, help="time per benchmark")
+    parser.add_argument("--filter", help="only run benchmarks matching this regex")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    application = load_application(args.app_dir)
+    results = run(build_benchmarks(application), args.seconds, args.filter)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    header = f"\n{'benchmark':<40} {'ops/sec':>12} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10}"
+    print(header + (f" {'vs base':>9}" if baseline else ""))
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name) if baseline else None
+        print_row(name, result, previous)
+        if previous and result["ops_per_sec"] < previous["ops_per_sec"] * (1 - args.tolerance):
+            regressions.append(name)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "seconds": args.seconds,
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import time
+from functools import lru_cache
+from io import BytesIO
+
+# Only the page size is imported up front: it is cheap, while the font metrics and
+# canvas modules are most of reportlab's import time and only a render needs them
+from reportlab.lib.pagesizes import letter
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN_X = 50
+TOP_Y = PAGE_HEIGHT - 50
+BOTTOM_Y = 60
+LINE_HEIGHT = 14
+SECTION_SPACING = 24
+SECTION_INDENT = 20
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN_X
+
+BODY_FONT = ("Helvetica", 12)
+LABEL_FONT = ("Helvetica-Bold", 12)
+HEADING_FONT = ("Helvetica-Bold", 14)
+FOOTER_FONT = ("Helvetica", 8)
+FOOTER_TEXT = "Panda's D&D Character Generator"
+
+# Header rows sit at fixed offsets under the name, so their labels live in the page chrome
+HEADER_LABELS = ("Race:", "Class:", "Gender:", "Background:", "Theme:", "Personal Item:")
+HEADER_VALUE_X = MARGIN_X + 110
+HEADER_TOP_Y = TOP_Y - LINE_HEIGHT
+STATS_TOP_Y = HEADER_TOP_Y - len(HEADER_LABELS) * LINE_HEIGHT - SECTION_SPACING
+
+# Keys a posted character needs for its sheet to render
+SHEET_FIELDS = ("name", "race", "class", "subclass", "gender", "background", "theme",
+                "personal_item", "stats", "appearance", "backstory")
+
+# Abilities are drawn in this order whatever order they were posted in (jsonify sorts
+# keys, so a sheet posted back from the UI arrives alphabetical); anything else follows
+STAT_ORDER = {stat: index for index, stat in enumerate(("STR", "DEX", "CON", "INT", "WIS", "CHA"))}
+
+FIRST_PAGE_CHROME = "sheetFirstPage"
+PAGE_CHROME = "sheetPage"
+
+
+@lru_cache(maxsize=16384)
+def text_width(text, font):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    return stringWidth(text, *font)
+
+
+def _break_word(word, font, max_width):
+    # One pass over per-character widths (the base fonts have no kerning, so widths
+    # add up). Only single characters go through the width cache, never prefixes.
+    pieces = []
+    start = 0
+    width = 0.0
+    for index, char in enumerate(word):
+        char_width = text_width(char, font)
+        if width + char_width > max_width and index > start:
+            pieces.append(word[start:index])
+            start, width = index, 0.0
+        width += char_width
+    pieces.append(word[start:])
+    return pieces
+
+
+def wrap_text(text, font, max_width):
+    # Greedy line breaking on real glyph widths. Word widths are memoized, so a
+    # repeated backstory only measures each distinct word once.
+    space = text_width(" ", font)
+    lines = []
+    line = []
+    line_width = 0.0
+    for word in text.split():
+        width = text_width(word, font)
+        if width > max_width:
+            # A single word wider than the line is broken at the last character that fits
+            if line:
+                lines.append(" ".join(line))
+                line, line_width = [], 0.0
+            pieces = _break_word(word, font, max_width)
+            lines.extend(pieces[:-1])
+            word = pieces[-1]
+            width = text_width(word, font)
+        if line and line_width + space + width > max_width:
+            lines.append(" ".join(line))
+            line, line_width = [word], width
+        elif line:
+            line.append(word)
+            line_width += space + width
+        else:
+            line, line_width = [word], width
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def fit_text(text, font, max_width):
+    # Single-line fields are cut with an ellipsis rather than overflowing the margin
+    if text_width(text, font) <= max_width:
+        return text
+    while text and text_width(text + "...", font) > max_width:
+        text = text[:-1]
+    return text.rstrip() + "..."
+
+
+class SheetRenderer:
+    # Draws one or more character sheets onto a single canvas. Text for the current
+    # page is batched in one text object and setFont is only emitted on a change.
+
+    def __init__(self, buffer):
+        from reportlab.pdfgen import canvas
+        self.canvas = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+        self._chrome_drawn = set()
+        self._chrome_forms = set()
+        self._text = None
+        self._font = None
+        self.y = TOP_Y
+        self._pages = 0
+
+    def _draw_chrome(self, name):
+        # The static page furniture is drawn inline the first time; once a second page
+        # needs it, it is captured as a form XObject and every later page just
+        # references it. A lone single-page sheet skips the extra XObject entirely.
+        c = self.canvas
+        if name in self._chrome_forms:
+            c.doForm(name)
+            return
+        if name in self._chrome_drawn:
+            c.beginForm(name)
+            self._draw_chrome_ops(name)
+            c.endForm()
+            self._chrome_forms.add(name)
+            c.doForm(name)
+            return
+        self._chrome_drawn.add(name)
+        c.saveState()
+        self._draw_chrome_ops(name)
+        c.restoreState()
+
+    def _draw_chrome_ops(self, name):
+        c = self.canvas
+        self._draw_footer()
+        if name == FIRST_PAGE_CHROME:
+            c.setFont(*LABEL_FONT)
+            for row, label in enumerate(HEADER_LABELS):
+                c.drawString(MARGIN_X, HEADER_TOP_Y - row * LINE_HEIGHT, label)
+            c.setFont(*HEADING_FONT)
+            c.drawString(MARGIN_X, STATS_TOP_Y, "Stats:")
+
+    def _draw_footer(self):
+        c = self.canvas
+        c.setLineWidth(0.5)
+        c.line(MARGIN_X, BOTTOM_Y - 12, PAGE_WIDTH - MARGIN_X, BOTTOM_Y - 12)
+        c.setFont(*FOOTER_FONT)
+        c.drawRightString(PAGE_WIDTH - MARGIN_X, BOTTOM_Y - 24, FOOTER_TEXT)
+
+    def _start_page(self, chrome):
+        if self._pages:
+            self._flush()
+            self.canvas.showPage()
+        self._pages += 1
+        self._draw_chrome(chrome)
+        self._text = self.canvas.beginText()
+        self._font = None
+        self.y = TOP_Y
+
+    def _flush(self):
+        if self._text is not None:
+            self.canvas.drawText(self._text)
+            self._text = None
+
+    def _line(self, text, x, y, font):
+        if font != self._font:
+            self._text.setFont(*font)
+            self._font = font
+        self._text.setTextOrigin(x, y)
+        self._text.textOut(text)
+
+    def _flow(self, lines, font, indent=0):
+        for line in lines:
+            if self.y < BOTTOM_Y:
+                self._start_page(PAGE_CHROME)
+            self._line(line, MARGIN_X + indent, self.y, font)
+            self.y -= LINE_HEIGHT
+
+    def _section(self, title, content):
+        self._flow([title], HEADING_FONT)
+        width = TEXT_WIDTH - SECTION_INDENT
+        if isinstance(content, list):
+            for item in content:
+                self._flow(wrap_text(f"- {item}", BODY_FONT, width), BODY_FONT, SECTION_INDENT)
+        elif isinstance(content, str):
+            for para in content.strip().split("\n"):
+                if para.strip():
+                    self._flow(wrap_text(para, BODY_FONT, width), BODY_FONT, SECTION_INDENT)
+        self.y -= SECTION_SPACING
+
+    def add_sheet(self, data):
+        self._start_page(FIRST_PAGE_CHROME)
+
+        # --- HEADER ---
+        self._line(fit_text(str(data["name"]), HEADING_FONT, TEXT_WIDTH), MARGIN_X, TOP_Y, HEADING_FONT)
+        values = (
+            data["race"],
+            f"{data['class']} ({data['subclass']})",
+            data["gender"],
+            data["background"],
+            data["theme"]["name"],
+            data["personal_item"],
+        )
+        value_width = PAGE_WIDTH - MARGIN_X - HEADER_VALUE_X
+        for row, value in enumerate(values):
+            self._line(fit_text(str(value), BODY_FONT, value_width), HEADER_VALUE_X,
+                       HEADER_TOP_Y - row * LINE_HEIGHT, BODY_FONT)
+
+        # --- STATS --- (heading is part of the page chrome)
+        self.y = STATS_TOP_Y - LINE_HEIGHT
+        stats = sorted(data["stats"].items(), key=lambda item: (STAT_ORDER.get(item[0], len(STAT_ORDER)), item[0]))
+        for stat, val in stats:
+            self._flow(wrap_text(f"- {stat}: {val}", BODY_FONT, TEXT_WIDTH - SECTION_INDENT),
+                       BODY_FONT, SECTION_INDENT)
+        self.y -= SECTION_SPACING
+
+        # --- Appearance / Backstory ---
+        self._section("Appearance:", data["appearance"])
+        self._section("Backstory:", data["backstory"])
+
+    def save(self):
+        self._flush()
+        self.canvas.save()
+
+
+def render_character_pdf(data):
+    buffer = BytesIO()
+    renderer = SheetRenderer(buffer)
+    renderer.add_sheet(data)
+    renderer.save()
+    buffer.seek(0)
+    return buffer
+
+
+def render_sheet_bytes(data):
+    return render_character_pdf(data).getvalue()
+
+
+def render_sheet_with_timings(data):
+    # (pdf bytes, layout seconds, save seconds) for the request's stage metrics
+    start = time.perf_counter()
+    buffer = BytesIO()
+    renderer = SheetRenderer(buffer)
+    renderer.add_sheet(data)
+    laid_out = time.perf_counter()
+    renderer.save()
+    return buffer.getvalue(), laid_out - start, time.perf_counter() - laid_out
+
+
+def render_sheets_pdf(characters):
+    # Every character on its own page(s) of one document
+    buffer = BytesIO()
+    renderer = SheetRenderer(buffer)
+    for data in characters:
+        renderer.add_sheet(data)
+    renderer.save()
+    return buffer.getvalue()
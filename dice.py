@@ -0,0 +1,141 @@
+import itertools
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from sampling import AliasTable
+
+STAT_NAMES = ("STR", "DEX", "CON", "INT", "WIS", "CHA")
+STATS_DTYPE = np.dtype([(stat, np.int16) for stat in STAT_NAMES])
+
+STAT_METHODS = ("4d6", "3d6", "standard", "pointbuy")
+STANDARD_ARRAY = (15, 14, 13, 12, 10, 8)
+POINT_BUY_COSTS = {8: 0, 9: 1, 10: 2, 11: 3, 12: 4, 13: 5, 14: 7, 15: 9}
+POINT_BUY_BUDGET = 27
+# "dice" rolls every die; "alias" draws each 4d6 score from its exact distribution
+STAT_ENGINES = ("dice", "alias")
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_LOW32 = np.uint64(0xFFFFFFFF)
+
+
+def _splitmix64(z):
+    z = (z ^ (z >> np.uint64(30))) * _MIX1
+    z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+def uniform_words(keys, count):
+    # `count` independent 32-bit words per key. Counter-based (SplitMix64 over
+    # key + i * golden), so a key always yields the same words whether it is
+    # rolled alone or as part of a large batch.
+    keys = np.asarray(keys, dtype=np.uint64).reshape(-1, 1)
+    counters = np.arange(1, (count + 1) // 2 + 1, dtype=np.uint64) * _GOLDEN
+    with np.errstate(over="ignore"):
+        hashed = _splitmix64(keys + counters)
+    words = np.empty((keys.shape[0], hashed.shape[1] * 2), dtype=np.uint64)
+    words[:, 0::2] = hashed >> np.uint64(32)
+    words[:, 1::2] = hashed & _LOW32
+    return words[:, :count]
+
+
+def roll_dice(keys, count, sides):
+    # Multiply-shift maps a 32-bit word onto 1..sides without a modulo
+    return (uniform_words(keys, count) * np.uint64(sides) >> np.uint64(32)).astype(np.int16) + 1
+
+
+def _dice_counts(count, sides, drop_lowest):
+    # Exact {score: number of outcomes} by enumerating every roll (1296 for 4d6)
+    counts = Counter()
+    for roll in itertools.product(range(1, sides + 1), repeat=count):
+        counts[sum(roll) - (min(roll) if drop_lowest else 0)] += 1
+    return dict(sorted(counts.items()))
+
+
+def _point_buy_rows():
+    # Every assignment of 8..15 to the six abilities that spends exactly the budget
+    scores = np.array(list(POINT_BUY_COSTS), dtype=np.int16)
+    costs = np.array(list(POINT_BUY_COSTS.values()), dtype=np.int16)
+    grid = np.indices((len(scores),) * len(STAT_NAMES)).reshape(len(STAT_NAMES), -1).T
+    return scores[grid[costs[grid].sum(axis=1) == POINT_BUY_BUDGET]]
+
+
+class _ScoreTable:
+    # Abilities drawn independently from one distribution through a vectorized alias
+    # table: one 32-bit word picks the column, a second decides column or alias
+    def __init__(self, counts):
+        self.counts = counts
+        self.outcomes = sum(counts.values())
+        self.values = np.array(list(counts), dtype=np.int16)
+        table = AliasTable(list(counts.values()))
+        self.threshold = np.array([min(int(p * 2 ** 32), 2 ** 32) for p in table.probability], dtype=np.uint64)
+        self.alias = np.array(table.alias, dtype=np.intp)
+
+    def draw(self, keys):
+        words = uniform_words(keys, len(STAT_NAMES) * 2)
+        column = (words[:, 0::2] * np.uint64(len(self.values)) >> np.uint64(32)).astype(np.intp)
+        index = np.where(words[:, 1::2] < self.threshold[column], column, self.alias[column])
+        return self.values[index]
+
+
+class _RowTable:
+    # Whole stat lines drawn uniformly from a fixed list (standard array orders, point-buy spends)
+    def __init__(self, rows):
+        self.rows = rows
+        self.outcomes = len(rows)
+        values, counts = np.unique(rows, return_counts=True)
+        # Every ability has the same marginal, since the rows cover every ordering
+        self.counts = {int(v): int(c) // len(STAT_NAMES) for v, c in zip(values, counts)}
+
+    def draw(self, keys):
+        index = uniform_words(keys, 1)[:, 0] * np.uint64(self.outcomes) >> np.uint64(32)
+        return self.rows[index.astype(np.intp)]
+
+
+_STAT_TABLE_BUILDERS = {
+    "4d6": lambda: _ScoreTable(_dice_counts(4, 6, drop_lowest=True)),
+    "3d6": lambda: _ScoreTable(_dice_counts(3, 6, drop_lowest=False)),
+    "standard": lambda: _RowTable(np.array(sorted(set(itertools.permutations(STANDARD_ARRAY))), dtype=np.int16)),
+    "pointbuy": lambda: _RowTable(_point_buy_rows()),
+}
+
+
+@lru_cache(maxsize=None)
+def stat_table(method):
+    # Built on first use; the point-buy enumeration alone is a noticeable share of import time
+    return _STAT_TABLE_BUILDERS[method]()
+
+
+def stat_distribution(method, max_level=20):
+    # The exact per-ability distribution behind a method and its mean at each level
+    table = stat_table(method)
+    expected = sum(score * count for score, count in table.counts.items()) / table.outcomes
+    return {
+        "method": method,
+        "outcomes": table.outcomes,
+        "scores": [{"score": score, "count": count, "probability": count / table.outcomes}
+                   for score, count in table.counts.items()],
+        "expected": expected,
+        "expected_by_level": {level: expected + level // 2 for level in range(1, max_level + 1)},
+    }
+
+
+def roll_stats_batch(keys, level, as_dicts=False, method="4d6", engine="dice"):
+    # Scores for every ability of every key in one array operation, plus the
+    # level // 2 bonus. 4d6-drop-lowest is rolled die by die with the "dice"
+    # engine; everything else comes from the precomputed tables. Returns a
+    # structured array with one field per ability, or a list of {"STR": .., ...} dicts.
+    if method == "4d6" and engine == "dice":
+        dice = roll_dice(keys, len(STAT_NAMES) * 4, 6).reshape(-1, len(STAT_NAMES), 4)
+        scores = dice.sum(axis=2) - dice.min(axis=2) + level // 2
+    else:
+        scores = stat_table(method).draw(keys) + level // 2
+    if as_dicts:
+        return [dict(zip(STAT_NAMES, row)) for row in scores.tolist()]
+    rolled = np.empty(scores.shape[0], dtype=STATS_DTYPE)
+    for i, stat in enumerate(STAT_NAMES):
+        rolled[stat] = scores[:, i]
+    return rolled
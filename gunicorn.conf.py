@@ -0,0 +1,43 @@
+import gc
+import os
+import random
+
+from dotenv import load_dotenv
+
+# .env has to be in the environment before on_starting imports metrics, which reads
+# METRICS_DIR on import (application.py loads it again, which changes nothing)
+load_dotenv()
+
+# Load application.py once in the master so name pools, appearance tables and
+# reportlab's font metrics are shared copy-on-write by every worker.
+# GUNICORN_PRELOAD=0 goes back to importing the app separately in each worker.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+# Threads per worker; more than 1 switches sync workers to gthread. admission.py sizes
+# its default concurrency limits from the same setting.
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+
+
+def on_starting(server):
+    # Per-worker metric files from a previous run would otherwise be summed into /metrics
+    import metrics
+    metrics.clear_dir()
+
+
+def when_ready(server):
+    if preload_app:
+        import application
+        application.warm_up()
+        # Keep the warmed-up objects out of future collections so the GC doesn't
+        # touch (and un-share) their pages in every worker
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # Forked workers inherit the master's random state; without this they would all
+    # hand out the same sequence of "random" characters
+    random.seed()
+
+
+def post_worker_init(worker):
+    import application
+    application.warm_up(start_pdf_pool=True)
@@ -0,0 +1,160 @@
+import heapq
+import logging
+import os
+import queue
+import smtplib
+import time
+
+import background
+import metrics
+
+logger = logging.getLogger("dndproject")
+
+SMTP_HOST = os.environ.get("SMTP_HOST")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+# "starttls" (default), "ssl" for implicit TLS on 465, or "none" for a local relay/test server
+SMTP_SECURITY = os.environ.get("SMTP_SECURITY", "starttls")
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", "10"))
+
+MAIL_QUEUE_SIZE = int(os.environ.get("MAIL_QUEUE_SIZE", "1000"))
+# Messages sent back to back on one connection before checking for retries again
+MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", "20"))
+MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_RETRY_DELAY = float(os.environ.get("MAIL_RETRY_DELAY", "2"))
+MAIL_RETRY_MAX_DELAY = float(os.environ.get("MAIL_RETRY_MAX_DELAY", "300"))
+# An idle connection is closed after this long rather than left for the server to drop
+MAIL_IDLE_TIMEOUT = float(os.environ.get("MAIL_IDLE_TIMEOUT", "30"))
+
+SEND_SECONDS = metrics.Histogram(
+    "dnd_mail_send_seconds", "Time for the SMTP server to accept one message")
+DELIVERY_SECONDS = metrics.Histogram(
+    "dnd_mail_delivery_seconds", "Time from a message being queued to the SMTP server accepting it")
+
+
+class QueueFull(background.QueueFull):
+    pass
+
+
+class _Item:
+    __slots__ = ("message", "queued_at", "attempts")
+
+    def __init__(self, message):
+        self.message = message
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+
+
+def configured():
+    return bool(SMTP_HOST)
+
+
+class _Outbox(background.BackgroundQueue):
+    # Sends in batches over one SMTP connection, kept open until MAIL_IDLE_TIMEOUT.
+    # A message stays pending (and in depth()) while it waits to be retried.
+    full_error = QueueFull
+
+    def reset(self):
+        self.connection = None
+        self.last_used = 0.0
+        self.retries = []  # heap of (due, sequence, item)
+        self.sequence = 0
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self.connection is not None and time.monotonic() - self.last_used > MAIL_IDLE_TIMEOUT:
+                    self._close()
+                continue
+            for item in batch:
+                self._send(item)
+
+    def _next_batch(self):
+        # Due retries first, then new messages, up to MAIL_BATCH_SIZE; waits for the
+        # next due retry (or an idle check) when there is nothing to do
+        now = time.monotonic()
+        batch = []
+        while self.retries and self.retries[0][0] <= now and len(batch) < MAIL_BATCH_SIZE:
+            batch.append(heapq.heappop(self.retries)[2])
+        if not batch:
+            timeout = min(self.retries[0][0] - now, MAIL_IDLE_TIMEOUT) if self.retries else MAIL_IDLE_TIMEOUT
+            try:
+                batch.append(self.get(timeout=max(timeout, 0.01)))
+            except queue.Empty:
+                pass
+        while batch and len(batch) < MAIL_BATCH_SIZE:
+            try:
+                batch.append(self.get(timeout=0))
+            except queue.Empty:
+                break
+        return batch
+
+    def _connect(self):
+        if SMTP_SECURITY == "ssl":
+            connection = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        else:
+            connection = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_SECURITY == "starttls":
+                connection.starttls()
+        if SMTP_USERNAME:
+            connection.login(SMTP_USERNAME, SMTP_PASSWORD or "")
+        return connection
+
+    def _close(self):
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.connection = None
+
+    def _send(self, item):
+        item.attempts += 1
+        start = time.monotonic()
+        try:
+            if self.connection is None:
+                self.connection = self._connect()
+            self.connection.send_message(item.message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as error:
+            # The server said no to this message; sending it again won't change that
+            logger.error("mail rejected by the SMTP server: %s", error)
+            self.count("failed")
+            self.done()
+            return
+        except (smtplib.SMTPException, OSError) as error:
+            # Connection-level or temporary trouble: start over with a fresh connection
+            if self.connection is not None:
+                self._close()
+            self._retry(item, error)
+            return
+        finished = time.monotonic()
+        self.last_used = finished
+        SEND_SECONDS.observe(finished - start)
+        DELIVERY_SECONDS.observe(finished - item.queued_at)
+        self.count("sent")
+        self.done()
+
+    def _retry(self, item, error):
+        if item.attempts >= MAIL_MAX_ATTEMPTS:
+            logger.error("giving up on mail after %d attempts: %s", item.attempts, error)
+            self.count("failed")
+            self.done()
+            return
+        delay = min(MAIL_RETRY_DELAY * 2 ** (item.attempts - 1), MAIL_RETRY_MAX_DELAY)
+        logger.warning("mail send failed (%s), retrying in %.1fs", error, delay)
+        self.count("retried")
+        self.sequence += 1
+        heapq.heappush(self.retries, (time.monotonic() + delay, self.sequence, item))
+
+
+_outbox = _Outbox("mail-sender", MAIL_QUEUE_SIZE, ("sent", "retried", "failed"))
+stats = _outbox.stats
+# Waiting to be sent for the first time, waiting to be retried, or in hand
+depth = _outbox.depth
+drain = _outbox.drain
+
+
+def enqueue(message):
+    # Returns straight away; the message is sent by this process's background thread
+    _outbox.put(_Item(message))
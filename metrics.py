@@ -0,0 +1,243 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# When set, every process periodically writes its samples here and /metrics sums them,
+# so a scrape that lands on any one gunicorn worker sees the totals for all of them
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+
+_registry = {}
+_flusher_pid = None
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._samples = {}
+        _registry[name] = self
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: _copy(value) for labels, value in self._samples.items()}
+
+
+def _copy(value):
+    return [list(value[0]), value[1]] if isinstance(value, list) else value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._samples[labels] = self._samples.get(labels, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        # Stored per bucket (not cumulative) plus the sum; cumulated when rendered
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._samples.get(labels)
+            if sample is None:
+                sample = self._samples[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            sample[0][index] += 1
+            sample[1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+
+class Gauge(_Metric):
+    # Read from a callback at scrape time, e.g. a queue length. With labelnames the
+    # callback returns {label values tuple: value}.
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def snapshot(self):
+        if self.labelnames:
+            return {tuple(labels): float(value) for labels, value in self.fn().items()}
+        return {(): float(self.fn())}
+
+
+class CounterFunc(Gauge):
+    # A monotonically increasing value owned by some other module
+    kind = "counter"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, self.labels)
+
+
+def _process_snapshot():
+    return {
+        "pid": os.getpid(),
+        "metrics": {
+            name: {
+                "kind": metric.kind,
+                "help": metric.help,
+                "labelnames": metric.labelnames,
+                "buckets": getattr(metric, "buckets", None),
+                "samples": [[list(labels), value] for labels, value in metric.snapshot().items()],
+            }
+            for name, metric in _registry.items()
+        },
+    }
+
+
+def flush(force=False):
+    # Cheap to call on every request: the file is written by a background thread once
+    # per METRICS_FLUSH_INTERVAL, or right away when forced (a scrape)
+    global _flusher_pid
+    if not METRICS_DIR:
+        return
+    if force:
+        _write_snapshot()
+    elif _flusher_pid != os.getpid():
+        # One thread per process; threads don't survive a fork, so check the pid
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, args=(_flusher_pid,), name="metrics-flush", daemon=True).start()
+
+
+def _flush_loop(pid):
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        if _flusher_pid != pid:
+            return
+        _write_snapshot()
+
+
+def _write_snapshot():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(_process_snapshot(), f)
+    os.replace(tmp_path, os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json"))
+
+
+def reset():
+    # Forgets everything this process recorded so far, e.g. warm-up requests made in
+    # the gunicorn master that every forked worker would otherwise inherit
+    global _flusher_pid
+    _flusher_pid = None
+    for metric in _registry.values():
+        with metric._lock:
+            metric._samples.clear()
+    if METRICS_DIR:
+        try:
+            os.remove(os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json"))
+        except FileNotFoundError:
+            pass
+
+
+def clear_dir():
+    # Called by the gunicorn master at startup so counters restart with the server
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+            os.remove(path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect():
+    if not METRICS_DIR:
+        return [_process_snapshot()]
+    flush(force=True)
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        alive = _pid_alive(snapshot["pid"])
+        for name, metric in snapshot["metrics"].items():
+            # Counters from exited workers still count; their gauges are stale
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric["samples"]:
+                labels = tuple(labels)
+                if metric["kind"] == "histogram":
+                    current = target["samples"].setdefault(labels, [[0] * len(value[0]), 0.0])
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                else:
+                    target["samples"][labels] = target["samples"].get(labels, 0) + value
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(labelnames, labels, extra=()):
+    pairs = [f'{key}="{_escape(value)}"' for key, value in list(zip(labelnames, labels)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render():
+    # Prometheus text exposition format (version 0.0.4)
+    lines = []
+    for name, metric in sorted(_merge(_collect()).items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labelnames = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_label_text(labelnames, labels)} {value}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(labelnames, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labelnames, labels)} {total}")
+            lines.append(f"{name}_count{_label_text(labelnames, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
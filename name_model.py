@@ -0,0 +1,289 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from permutation import mix64
+from sampling import AliasTable
+
+logger = logging.getLogger("dndproject")
+
+# Characters of context per step. 2 keeps a race's flavour while its ~20 names per file
+# still recombine into new ones; 3 mostly copies the input back out.
+NAME_MODEL_ORDER = int(os.environ.get("NAME_MODEL_ORDER", "2"))
+# Chance per letter of borrowing the next one from the model trained on every race
+NAME_MODEL_BLEND = float(os.environ.get("NAME_MODEL_BLEND", "0.1"))
+# Spellings compiled per race and name part, as a power of two. Names are served from
+# these tables, so 4096 first names and 4096 last names give up to 16.7 million full
+# names per race.
+NAME_TABLE_BITS = int(os.environ.get("NAME_TABLE_BITS", "12"))
+# Compiled models are written here (keyed by a digest of the corpus and settings) so a
+# restart loads them instead of compiling again; an empty value turns the cache off
+NAME_MODEL_CACHE_DIR = os.environ.get("NAME_MODEL_CACHE_DIR", tempfile.gettempdir())
+NAME_MIN_LENGTH = 3
+NAME_MAX_LENGTH = 14
+FORMAT_VERSION = 2
+
+# A modelled name is a single word; anything else in a file (the placeholder Fairy
+# lists, say) is left out of training
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z'-]*")
+PARTS = ("first", "last")
+BOUNDARY = 0
+MASK64 = (1 << 64) - 1
+
+
+def _trainable(names):
+    words = [name for name in names if WORD_PATTERN.fullmatch(name)]
+    # Multi-word entries ("Silent Step", "of the Jungle") are phrases, not spellings,
+    # so a part made of them is served from its list as it is
+    if len(words) < len(names) and any(" " in name for name in names):
+        return None
+    return words or None
+
+
+def _transitions(names, order):
+    # {context tuple: {next symbol: count}}, with BOUNDARY padding at both ends
+    counts = {}
+    for name in names:
+        symbols = (BOUNDARY,) * order + tuple(name) + (BOUNDARY,)
+        for i in range(order, len(symbols)):
+            followers = counts.setdefault(symbols[i - order:i], {})
+            followers[symbols[i]] = followers.get(symbols[i], 0) + 1
+    return counts
+
+
+def train(pools, generic_pool, order=NAME_MODEL_ORDER):
+    # pools maps a race key to (first names, last names). Each usable part gets its own
+    # model; a generic model per part is trained on every race's names together and
+    # serves races with no pool or no usable part. The models are flattened into
+    # arrays: one row per (model, context), sorted by model * radix**order + context,
+    # holding an alias table over the symbols that followed that context.
+    sources = {}
+    phrases = []
+    for key, pool in sorted(pools.items()):
+        for part, names in zip(PARTS, pool):
+            words = _trainable(names)
+            if words is not None:
+                sources[key, part] = words
+            elif any(" " in name for name in names):
+                phrases.append([key, part, list(names)])
+    for part, names in zip(PARTS, generic_pool):
+        words = set(names)
+        for (_, source_part), source in sources.items():
+            if source_part == part:
+                words.update(source)
+        sources[None, part] = sorted(words)
+
+    alphabet = sorted({char for words in sources.values() for word in words for char in word})
+    symbol_of = {char: i + 1 for i, char in enumerate(alphabet)}
+    radix = len(alphabet) + 1
+    modulus = radix ** order
+
+    models = []
+    state_keys, row_offsets, symbols, probability, alias = [], [0], [], [], []
+    for model_id, ((key, part), words) in enumerate(sources.items()):
+        models.append([key, part])
+        counts = _transitions([[symbol_of[char] for char in word] for word in words], order)
+        rows = []
+        for context, followers in counts.items():
+            state = 0
+            for symbol in context:
+                state = state * radix + symbol
+            rows.append((model_id * modulus + state, sorted(followers.items())))
+        for state_key, followers in sorted(rows):
+            table = AliasTable([count for _, count in followers])
+            state_keys.append(state_key)
+            # Alias entries point straight at the other transition in the flat arrays
+            alias.extend(len(symbols) + column for column in table.alias)
+            symbols.extend(symbol for symbol, _ in followers)
+            probability.extend(table.probability)
+            row_offsets.append(len(symbols))
+
+    # The row each transition leads to within its own model (-1 after the end), so a
+    # walk that doesn't borrow never has to look its next context up
+    row_of = {state_key: row for row, state_key in enumerate(state_keys)}
+    next_rows = []
+    for row, state_key in enumerate(state_keys):
+        model_base, state = divmod(state_key, modulus)
+        for transition in range(row_offsets[row], row_offsets[row + 1]):
+            symbol = symbols[transition]
+            next_rows.append(-1 if symbol == BOUNDARY else
+                             row_of[model_base * modulus + (state * radix + symbol) % modulus])
+
+    return {
+        "meta": {"version": FORMAT_VERSION, "order": order, "alphabet": "".join(alphabet),
+                 "models": models, "phrases": phrases},
+        "state_keys": np.array(state_keys, dtype=np.int64),
+        "row_offsets": np.array(row_offsets, dtype=np.int32),
+        "symbols": np.array(symbols, dtype=np.uint16),
+        "probability": np.array(probability, dtype=np.float64),
+        "alias": np.array(alias, dtype=np.int32),
+        "next_rows": np.array(next_rows, dtype=np.int32),
+    }
+
+
+def _find_rows(compiled, state_keys):
+    # Row index for each state key, -1 where the model never saw that context
+    keys = compiled["state_keys"]
+    rows = np.minimum(np.searchsorted(keys, state_keys), len(keys) - 1)
+    return np.where(keys[rows] == state_keys, rows, -1)
+
+
+def _spell_batch(compiled, model_ids, generic_ids, rng, blend):
+    # Runs one walk per entry of model_ids, all in lockstep. At each step a walk may
+    # borrow its letter from its generic model, which has seen every context the race
+    # model has, so it never dead-ends; the walk goes back to the race model as soon
+    # as the context is one the race knows. Borrowing is where most new spellings come
+    # from. Returns the model ids and spellings of the walks that ended within the
+    # length limits, in the order of model_ids.
+    meta = compiled["meta"]
+    radix = len(meta["alphabet"]) + 1
+    modulus = radix ** meta["order"]
+    offsets, symbols, next_rows = compiled["row_offsets"], compiled["symbols"], compiled["next_rows"]
+    probability, alias = compiled["probability"], compiled["alias"]
+    base, generic_base = model_ids * modulus, generic_ids * modulus
+
+    count = len(model_ids)
+    state = np.zeros(count, dtype=np.int64)
+    row = _find_rows(compiled, base)
+    out = np.zeros((count, NAME_MAX_LENGTH + 1), dtype=np.uint16)
+    length = np.zeros(count, dtype=np.int64)
+    active = np.ones(count, dtype=bool)
+    for step in range(NAME_MAX_LENGTH + 1):
+        walks = np.flatnonzero(active)
+        if not len(walks):
+            break
+        current = row[walks]
+        borrow = np.flatnonzero((current < 0) | (rng.random(len(walks)) < blend))
+        current[borrow] = _find_rows(compiled, generic_base[walks[borrow]] + state[walks[borrow]])
+        start = offsets[current]
+        u = rng.random(len(walks)) * (offsets[current + 1] - start)
+        column = u.astype(np.int64)
+        transition = start + column
+        transition = np.where(u - column < probability[transition], transition, alias[transition])
+        symbol = symbols[transition].astype(np.int64)
+        state[walks] = (state[walks] * radix + symbol) % modulus
+        following = next_rows[transition]
+        # A borrowed letter may lead somewhere the race model has never been
+        borrowed = walks[borrow]
+        following[borrow] = _find_rows(compiled, base[borrowed] + state[borrowed])
+        row[walks] = following
+        ended = symbol == BOUNDARY
+        active[walks[ended]] = False
+        going = walks[~ended]
+        out[going, step] = symbol[~ended]
+        length[going] += 1
+    # Walks still active here ran past NAME_MAX_LENGTH. Letters become strings in one
+    # go: code points laid out as a fixed-width unicode array, whose trailing NULs
+    # numpy drops.
+    keep = ~active & (length >= NAME_MIN_LENGTH)
+    code_points = np.array([0] + [ord(char) for char in meta["alphabet"]], dtype=np.uint32)
+    spellings = np.ascontiguousarray(code_points[out[keep]]).view(f"<U{NAME_MAX_LENGTH + 1}")[:, 0]
+    return model_ids[keep], spellings.tolist()
+
+
+def compile_tables(compiled, seed, blend=NAME_MODEL_BLEND, table_bits=NAME_TABLE_BITS):
+    # 2**table_bits spellings per model, drawn at their natural frequencies, stored as
+    # newline-joined text with a NUL between models. Every model walks at once, so
+    # numpy's per-call overhead is paid per step rather than per step and model.
+    size = 1 << table_bits
+    models = compiled["meta"]["models"]
+    generic_of = {part: model_id for model_id, (key, part) in enumerate(models) if key is None}
+    generic_ids = np.array([generic_of[part] for _, part in models], dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    spellings = [[] for _ in models]
+    short = np.arange(len(models))
+    while len(short):
+        model_ids = np.repeat(short, size + size // 4)
+        kept_ids, kept = _spell_batch(compiled, model_ids, generic_ids[model_ids], rng, blend)
+        bounds = np.searchsorted(kept_ids, short, side="right").tolist()
+        for model_id, low, high in zip(short.tolist(), [0] + bounds[:-1], bounds):
+            spellings[model_id] += kept[low:high]
+        short = np.array([model_id for model_id in short if len(spellings[model_id]) < size], dtype=np.int64)
+    tables = ["\n".join(table[:size]) for table in spellings]
+    compiled["tables"] = np.frombuffer("\0".join(tables).encode("utf-8"), dtype=np.uint8)
+    return compiled
+
+
+def corpus_digest(pools, generic_pool):
+    canonical = json.dumps([FORMAT_VERSION, NAME_MODEL_ORDER, NAME_MODEL_BLEND, NAME_TABLE_BITS,
+                            sorted(pools.items()), generic_pool])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def save(compiled, path):
+    meta = np.frombuffer(json.dumps(compiled["meta"]).encode("utf-8"), dtype=np.uint8)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, **dict(compiled, meta=meta))
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    with np.load(path, allow_pickle=False) as data:
+        compiled = {name: data[name] for name in data.files}
+    compiled["meta"] = json.loads(compiled["meta"].tobytes().decode("utf-8"))
+    if compiled["meta"]["version"] != FORMAT_VERSION:
+        raise ValueError("name model cache has an old format")
+    return compiled
+
+
+def load_or_train(pools, generic_pool):
+    pools = {key: [list(names) for names in pool] for key, pool in pools.items()}
+    generic_pool = [list(names) for names in generic_pool]
+    digest = corpus_digest(pools, generic_pool)
+    path = None
+    if NAME_MODEL_CACHE_DIR:
+        path = os.path.join(NAME_MODEL_CACHE_DIR, f"dnd-name-model-{digest}.npz")
+        try:
+            return NameModel(load(path))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as error:
+            logger.warning("Ignoring unreadable name model cache %s: %s", path, error)
+    # Seeded from the digest, so every process compiles the same tables
+    compiled = compile_tables(train(pools, generic_pool), int(digest, 16))
+    if path is not None:
+        try:
+            save(compiled, path)
+        except OSError as error:
+            logger.warning("Could not write name model cache %s: %s", path, error)
+    return NameModel(compiled)
+
+
+class NameModel:
+    # Serves names from the compiled spelling tables: one hash of the seed picks a
+    # first and a last name, so the same seed always gives the same name
+
+    def __init__(self, compiled):
+        meta = compiled["meta"]
+        tables = compiled["tables"].tobytes().decode("utf-8").split("\0")
+        # (race key, part) -> tuple of spellings, or the phrase list for a phrase part
+        self.tables = {(key, part): tuple(table.split("\n")) for (key, part), table in zip(meta["models"], tables)}
+        self.tables.update(((key, part), tuple(names)) for key, part, names in meta["phrases"])
+
+    def _table(self, race_key, part):
+        table = self.tables.get((race_key, part))
+        if table is None:
+            table = self.tables[None, part]
+        return table
+
+    def full_name(self, race_key, seed, draw=0):
+        # Each further draw is an independent pick, used to step around names a batch
+        # has already handed out
+        key = mix64((seed + draw * 0x9E3779B97F4A7C15) & MASK64)
+        first, last = self._table(race_key, "first"), self._table(race_key, "last")
+        return f"{first[key % len(first)]} {last[(key >> 32) % len(last)]}"
+
+    def unique_full_name(self, race_key, seed, exclude, max_draws=256):
+        # The first draw whose name isn't in exclude, as (name, draw); after max_draws
+        # collisions the last name is returned anyway
+        for draw in range(max_draws):
+            name = self.full_name(race_key, seed, draw)
+            if name not in exclude:
+                break
+        return name, draw
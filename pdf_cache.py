@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import character_sheet
+
+# Memory budget per web worker for rendered sheets; 0 turns the cache off
+PDF_CACHE_BYTES = int(os.environ.get("PDF_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Optional second tier shared by every worker and kept across restarts
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR")
+PDF_CACHE_DISK_BYTES = int(os.environ.get("PDF_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+# The disk tier is trimmed back under its budget once every this many writes
+DISK_PRUNE_EVERY = 64
+
+# Rendering is deterministic (invariant=1), so the same sheet fields always give the
+# same bytes. Hashing the renderer's source into every key means a layout change
+# can never be answered with a PDF drawn by the old code from the disk tier.
+with open(character_sheet.__file__, "rb") as f:
+    RENDERER_DIGEST = hashlib.sha256(f.read()).digest()
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_bytes = 0
+_disk_writes = 0
+_stats = {
+    "hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "evictions": 0,
+}
+
+
+def key_for(character):
+    # Only the fields drawn on the sheet count, in sheet order, so a character posted
+    # back with its seed/code (or its keys reordered) still hits. Nested keys are
+    # sorted too: the sheet draws the stats in a fixed order, not the order sent.
+    fields = [character.get(field) for field in character_sheet.SHEET_FIELDS]
+    canonical = json.dumps(fields, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
+    return hashlib.sha256(RENDERER_DIGEST + canonical.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    with _lock:
+        pdf = _entries.get(key)
+        if pdf is not None:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return pdf
+    pdf = _disk_get(key)
+    with _lock:
+        if pdf is None:
+            _stats["misses"] += 1
+            return None
+        _stats["disk_hits"] += 1
+    _memory_put(key, pdf)
+    return pdf
+
+
+def put(key, pdf):
+    _memory_put(key, pdf)
+    _disk_put(key, pdf)
+
+
+def _memory_put(key, pdf):
+    global _bytes
+    # Anything over an eighth of the budget would flush most of the cache for one sheet
+    if len(pdf) > PDF_CACHE_BYTES // 8:
+        return
+    with _lock:
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _bytes -= len(previous)
+        _entries[key] = pdf
+        _bytes += len(pdf)
+        while _bytes > PDF_CACHE_BYTES:
+            _, evicted = _entries.popitem(last=False)
+            _bytes -= len(evicted)
+            _stats["evictions"] += 1
+
+
+def _disk_path(key):
+    return os.path.join(PDF_CACHE_DIR, f"{key}.pdf")
+
+
+def _disk_get(key):
+    if not PDF_CACHE_DIR:
+        return None
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            pdf = f.read()
+        # mtime doubles as last use, so pruning drops the least recently used files
+        os.utime(path)
+    except OSError:
+        return None
+    return pdf
+
+
+def _disk_put(key, pdf):
+    global _disk_writes
+    if not PDF_CACHE_DIR:
+        return
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp_path, _disk_path(key))
+    except OSError:
+        # The disk tier is best effort; a full or read-only disk just means more renders
+        return
+    with _lock:
+        _disk_writes += 1
+        prune = _disk_writes % DISK_PRUNE_EVERY == 0
+    if prune:
+        prune_disk()
+
+
+def prune_disk():
+    files = []
+    for entry in os.scandir(PDF_CACHE_DIR):
+        if entry.name.endswith(".pdf"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= PDF_CACHE_DISK_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["entries"] = len(_entries)
+        snapshot["bytes"] = _bytes
+    snapshot["bytes_limit"] = PDF_CACHE_BYTES
+    snapshot["disk"] = bool(PDF_CACHE_DIR)
+    return snapshot
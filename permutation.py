@@ -0,0 +1,64 @@
+MASK64 = (1 << 64) - 1
+FEISTEL_ROUNDS = 4
+
+
+def mix64(value):
+    # SplitMix64 finalizer: a cheap, well-distributed 64-bit hash
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+class IndexPermutation:
+    # A keyed bijection on range(size), computed on demand: a balanced Feistel network
+    # over the next even power of two, cycle-walked back into range. Nothing is stored
+    # per index, and each lookup takes fewer than four passes on average.
+
+    def __init__(self, size, key):
+        if size < 1:
+            raise ValueError("size must be positive")
+        self.size = size
+        bits = max((size - 1).bit_length(), 2)
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.round_keys = tuple(mix64(key + i) for i in range(FEISTEL_ROUNDS))
+
+    def _encrypt(self, value):
+        # Round function: multiply-shift hash of the right half with the round key.
+        # The top bits of the 64-bit product are the well-mixed ones.
+        half_bits, half_mask = self.half_bits, self.half_mask
+        shift = 64 - half_bits
+        left, right = value >> half_bits, value & half_mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ ((((right ^ round_key) * 0x9E3779B97F4A7C15) & MASK64) >> shift)
+        return (left << half_bits) | right
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def __len__(self):
+        return self.size
+
+
+class PermutationWalk:
+    # Yields every index below size once, in a keyed pseudo-random order. When the
+    # space is used up the next lap starts over with a different permutation.
+
+    def __init__(self, size, key):
+        self.size = size
+        self.key = key
+        self.position = 0
+        self._permutation = None
+
+    def next(self):
+        lap, offset = divmod(self.position, self.size)
+        if offset == 0:
+            self._permutation = IndexPermutation(self.size, mix64(self.key + lap))
+        self.position += 1
+        return self._permutation[offset]
@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger("dndproject")
+
+# Keep ready-made /generate responses in memory, refilled by a background thread
+PREFETCH = os.environ.get("PREFETCH", "0") == "1"
+# Responses held per key, and the count below which the refill thread is woken
+PREFETCH_SIZE = int(os.environ.get("PREFETCH_SIZE", "16"))
+PREFETCH_LOW_WATERMARK = int(os.environ.get("PREFETCH_LOW_WATERMARK", "4"))
+
+REFILL_LAG_SECONDS = metrics.Histogram(
+    "dnd_prefetch_refill_lag_seconds", "Time from a prefetch buffer dropping below its low watermark to being full",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+class PrefetchBuffers:
+    # One bounded deque per key, filled by build(key). A key gets a buffer the first
+    # time it is asked for, so only keys that are actually requested take memory.
+    # Keys below the watermark are refilled round robin, one item at a time, so a
+    # burst on one key can't starve the rest.
+    def __init__(self, build, size=PREFETCH_SIZE, low_watermark=PREFETCH_LOW_WATERMARK, enabled=True):
+        self.build = build
+        self.enabled = enabled
+        self.size = size
+        self.low_watermark = min(low_watermark, size)
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._buffers = {}
+        self._low = {}  # key -> when it went below the watermark, oldest first
+        self._thread = None
+        self._thread_pid = None
+        self._stats = {"hits": 0, "misses": 0, "built": 0, "failed": 0}
+
+    def start(self):
+        # Per process, on the first pop; a gunicorn master must never pop, since a
+        # thread running in it when it forks would leave the workers with its locks held
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._buffers = {}
+                self._low = {}
+                self._thread = threading.Thread(target=self._refill, name="prefetch", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+                logger.info("prefetch started in process %d", self._thread_pid)
+
+    def running(self):
+        return self._thread_pid == os.getpid()
+
+    def pop(self, key):
+        # A ready item, or None when the buffer is empty (or prefetching is off)
+        if not self.enabled:
+            return None
+        if not self.running():
+            self.start()
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = deque(maxlen=self.size)
+            item = buffer.popleft() if buffer else None
+            self._stats["hits" if item is not None else "misses"] += 1
+            if len(buffer) < self.low_watermark and key not in self._low:
+                self._low[key] = time.monotonic()
+                self._wake.notify()
+        return item
+
+    def _refill(self):
+        while True:
+            with self._lock:
+                while not self._low:
+                    self._wake.wait()
+                # Take the key that has waited longest and put it back at the end
+                key = next(iter(self._low))
+                since = self._low.pop(key)
+            try:
+                item = self.build(key)
+            except Exception:
+                logger.exception("prefetch build failed for %r", key)
+                with self._lock:
+                    self._stats["failed"] += 1
+                # Don't spin on a key that can't be built
+                time.sleep(1.0)
+                continue
+            with self._lock:
+                buffer = self._buffers[key]
+                buffer.append(item)
+                self._stats["built"] += 1
+                full = len(buffer) >= self.size
+                if not full:
+                    self._low[key] = since
+            if full:
+                REFILL_LAG_SECONDS.observe(time.monotonic() - since)
+            # Hand the GIL over between builds, so a request arriving mid-refill waits
+            # for one build at most rather than a whole switch interval
+            time.sleep(0)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["buffered"] = sum(len(buffer) for buffer in self._buffers.values())
+            snapshot["keys"] = len(self._buffers)
+            snapshot["refilling"] = len(self._low)
+        snapshot["size"] = self.size
+        snapshot["low_watermark"] = self.low_watermark
+        return snapshot
@@ -0,0 +1,54 @@
+MAX_LEVEL = 20
+# Ability scores run from 3 (the lowest roll) to 18 before the level bonus
+MIN_SCORE = 3
+MAX_SCORE = 18
+
+PROGRESSION_COLUMNS = ("level", "hp_min", "hp_max", "hp_avg", "proficiency_bonus", "asi")
+ASI_LEVELS = (4, 8, 12, 16, 19)
+EXTRA_ASI_LEVELS = {"Fighter": (6, 14), "Rogue": (10,)}
+
+
+def ability_modifier(score):
+    return (score - 10) // 2
+
+
+def level_bonus(level):
+    # Characters gain +1 to every ability per two levels
+    return level // 2
+
+
+def proficiency_bonus(level):
+    return 2 + (level - 1) // 4
+
+
+def _hit_points(level, hit_die, modifier):
+    # Max die at level 1, then min / max / fixed average per later level, never below
+    # 1 per level. CON changes apply retroactively, so every level uses this modifier.
+    first = max(hit_die + modifier, 1)
+    later = level - 1
+    return (
+        first + later * max(1 + modifier, 1),
+        first + later * max(hit_die + modifier, 1),
+        first + later * max(hit_die // 2 + 1 + modifier, 1),
+    )
+
+
+def _progression(hit_die, base_con, asi_levels):
+    rows = []
+    for level in range(1, MAX_LEVEL + 1):
+        modifier = ability_modifier(base_con + level_bonus(level))
+        hp_min, hp_max, hp_avg = _hit_points(level, hit_die, modifier)
+        rows.append((level, hp_min, hp_max, hp_avg, proficiency_bonus(level), int(level in asi_levels)))
+    return tuple(rows)
+
+
+def build_progression_tables(hit_dice, default_hit_die):
+    # {(class or None, base CON score): rows for levels 1-20}. The base score is the
+    # level-less roll, so one table serves a character at every level. None is the
+    # fallback for classes without a hit die entry.
+    tables = {}
+    for char_class, hit_die in list(hit_dice.items()) + [(None, default_hit_die)]:
+        asi_levels = set(ASI_LEVELS).union(EXTRA_ASI_LEVELS.get(char_class, ()))
+        for base_con in range(MIN_SCORE, MAX_SCORE + 1):
+            tables[char_class, base_con] = _progression(hit_die, base_con, asi_levels)
+    return tables
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Render processes per web worker. Every gunicorn worker starts its own pool, so the
+# machine runs (web workers x PDF_WORKERS) renderers; raise it when there are spare
+# cores beyond what the web workers use, e.g. cpu_count // WEB_CONCURRENCY.
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "1"))
+# Renders allowed in flight (running + queued) per web worker before new ones are refused
+PDF_QUEUE_DEPTH = int(os.environ.get("PDF_QUEUE_DEPTH", str(PDF_WORKERS * 4)))
+# forkserver children start from a clean single-threaded process, which is safe to use
+# from threaded gunicorn workers; "fork" starts faster where that doesn't matter
+PDF_POOL_START_METHOD = os.environ.get("PDF_POOL_START_METHOD", "forkserver")
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PDF_QUEUE_DEPTH)
+_stats_lock = threading.Lock()
+_stats = {
+    "in_flight": 0,
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "render_seconds_total": 0.0,
+    "render_seconds_max": 0.0,
+    "wait_seconds_total": 0.0,
+}
+
+
+class PoolBusy(Exception):
+    pass
+
+
+def get_executor():
+    # Created lazily and per process: a pool inherited across fork() is unusable.
+    # A pool whose child died (OOM kill, crash) is broken for good, so it is replaced.
+    global _executor, _executor_pid, _slots
+    with _executor_lock:
+        forked = _executor_pid != os.getpid()
+        if _executor is None or forked or getattr(_executor, "_broken", False):
+            if _executor is not None and not forked:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            context = multiprocessing.get_context(PDF_POOL_START_METHOD)
+            _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+            _executor_pid = os.getpid()
+            if forked:
+                _slots = threading.BoundedSemaphore(PDF_QUEUE_DEPTH)
+                with _stats_lock:
+                    _stats["in_flight"] = 0
+        return _executor
+
+
+def _timed(fn, args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def submit(fn, *args, block=False):
+    # Returns a future for fn(*args). With block=False a full queue raises PoolBusy
+    # immediately instead of piling up work; callers turn that into a 503.
+    executor = get_executor()
+    slots = _slots
+    if not slots.acquire(blocking=block):
+        with _stats_lock:
+            _stats["rejected"] += 1
+        raise PoolBusy()
+    with _stats_lock:
+        _stats["in_flight"] += 1
+        _stats["submitted"] += 1
+    submitted_at = time.perf_counter()
+    try:
+        try:
+            inner = executor.submit(_timed, fn, args)
+        except BrokenProcessPool:
+            inner = get_executor().submit(_timed, fn, args)
+    except BaseException:
+        _finish(slots, None, submitted_at)
+        raise
+    inner.add_done_callback(lambda future: _finish(slots, future, submitted_at))
+    return _UnwrappedFuture(inner, fn, args)
+
+
+def _finish(slots, future, submitted_at):
+    slots.release()
+    elapsed = time.perf_counter() - submitted_at
+    with _stats_lock:
+        _stats["in_flight"] -= 1
+        if future is None or future.cancelled() or future.exception() is not None:
+            _stats["failed"] += 1
+            return
+        render_seconds = future.result()[0]
+        _stats["completed"] += 1
+        _stats["render_seconds_total"] += render_seconds
+        _stats["render_seconds_max"] = max(_stats["render_seconds_max"], render_seconds)
+        _stats["wait_seconds_total"] += max(elapsed - render_seconds, 0.0)
+
+
+class _UnwrappedFuture:
+    # Hides the (render_seconds, result) pair produced by _timed. A job lost with a
+    # dead pool child is run once more on the replacement pool.
+    def __init__(self, future, fn, args):
+        self._future = future
+        self._fn = fn
+        self._args = args
+        self._retried = False
+
+    def result(self, timeout=None):
+        try:
+            return self._future.result(timeout)[1]
+        except BrokenProcessPool:
+            if self._retried:
+                raise
+        self._retried = True
+        self._future = submit(self._fn, *self._args, block=True)._future
+        return self._future.result(timeout)[1]
+
+    def cancel(self):
+        return self._future.cancel()
+
+
+def check_capacity():
+    # Fail-fast check for work that will be submitted later (e.g. a streamed export)
+    with _stats_lock:
+        if _stats["in_flight"] >= PDF_QUEUE_DEPTH:
+            _stats["rejected"] += 1
+            raise PoolBusy()
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["workers"] = PDF_WORKERS
+    snapshot["queue_depth_limit"] = PDF_QUEUE_DEPTH
+    completed = snapshot["completed"]
+    snapshot["render_seconds_avg"] = snapshot["render_seconds_total"] / completed if completed else 0.0
+    snapshot["wait_seconds_avg"] = snapshot["wait_seconds_total"] / completed if completed else 0.0
+    return snapshot
+
+
+def map_ordered(fn, items, window=None):
+    # Like executor.map, but keeps at most `window` tasks in flight and yields each
+    # result as soon as it (and everything before it) is done, so neither the inputs
+    # nor the outputs have to be held in memory all at once. Waits for free queue
+    # slots rather than failing, so long exports share the pool with single renders.
+    window = min(window or PDF_WORKERS * 2, PDF_QUEUE_DEPTH)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(submit(fn, item, block=True))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
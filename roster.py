@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import background
+import metrics
+from character_sheet import SHEET_FIELDS
+
+logger = logging.getLogger("dndproject")
+
+# SQLite file saved characters go to, shared by every worker; unset turns the roster off
+ROSTER_DB = os.environ.get("ROSTER_DB")
+# Characters accepted but not yet committed, per process, before saves are refused
+ROSTER_QUEUE_SIZE = int(os.environ.get("ROSTER_QUEUE_SIZE", "10000"))
+# Saves are committed together: up to this many characters per transaction, or whatever
+# has arrived ROSTER_COMMIT_INTERVAL seconds after the first of them
+ROSTER_BATCH_SIZE = int(os.environ.get("ROSTER_BATCH_SIZE", "500"))
+ROSTER_COMMIT_INTERVAL = float(os.environ.get("ROSTER_COMMIT_INTERVAL", "0.25"))
+# How long a connection waits on another process's write lock before giving up
+ROSTER_BUSY_TIMEOUT = float(os.environ.get("ROSTER_BUSY_TIMEOUT", "5"))
+# Ids per query when fetching a list of characters, well under SQLite's variable limit
+FETCH_CHUNK = 500
+
+COMMIT_SECONDS = metrics.Histogram(
+    "dnd_roster_commit_seconds", "Time to write and commit one batch of saved characters")
+
+# SQLite ends every index with the rowid, so "race = ? AND id < ? ORDER BY id DESC"
+# is a single range scan of characters_race however deep the page is
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    roster TEXT NOT NULL,
+    race TEXT NOT NULL,
+    class TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    code TEXT,
+    sheet TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS characters_race ON characters (race);
+CREATE INDEX IF NOT EXISTS characters_class ON characters (class);
+CREATE INDEX IF NOT EXISTS characters_level ON characters (level);
+CREATE INDEX IF NOT EXISTS characters_created ON characters (created);
+CREATE INDEX IF NOT EXISTS characters_roster ON characters (roster);
+"""
+FILTER_COLUMNS = ("roster", "race", "class", "level")
+INSERT = ("INSERT INTO characters (created, roster, race, class, level, name, code, sheet) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+SELECT = "SELECT id, created, roster, level, code, sheet FROM characters"
+
+
+class NotConfigured(Exception):
+    pass
+
+
+class QueueFull(background.QueueFull):
+    pass
+
+
+_schema_pid = None
+_local = threading.local()
+
+
+def configured():
+    return bool(ROSTER_DB)
+
+
+def _connect():
+    global _schema_pid
+    first = _schema_pid != os.getpid()
+    if first:
+        os.makedirs(os.path.dirname(os.path.abspath(ROSTER_DB)), exist_ok=True)
+    connection = sqlite3.connect(ROSTER_DB, timeout=ROSTER_BUSY_TIMEOUT, isolation_level=None)
+    # WAL lets readers carry on while a batch commits; NORMAL only syncs at checkpoints,
+    # which in WAL mode can lose the last commits on power loss but never corrupts
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    if first:
+        connection.executescript(SCHEMA)
+        _schema_pid = os.getpid()
+    return connection
+
+
+def _reader():
+    # sqlite3 connections stay in the thread (and process) that opened them
+    if not configured():
+        raise NotConfigured()
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.connection = _connect()
+        _local.pid = os.getpid()
+    return _local.connection
+
+
+def _row(roster, character):
+    sheet = {field: character[field] for field in SHEET_FIELDS}
+    code = character.get("code")
+    return (roster, character["race"], character["class"], character["level"], character["name"],
+            code if isinstance(code, str) else None,
+            json.dumps(sheet, ensure_ascii=False, separators=(",", ":")))
+
+
+class _Writer(background.BackgroundQueue):
+    # Items are (roster name, [characters]); pending counts characters
+    full_error = QueueFull
+
+    def reset(self):
+        self.connection = None
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            self._write(batch)
+            self.done(len(batch))
+
+    def _next_batch(self):
+        roster, characters = self.get()
+        batch = [(roster, character) for character in characters]
+        deadline = time.monotonic() + ROSTER_COMMIT_INTERVAL
+        while len(batch) < ROSTER_BATCH_SIZE:
+            try:
+                roster, characters = self.get(timeout=deadline - time.monotonic())
+            except queue.Empty:
+                break
+            batch.extend((roster, character) for character in characters)
+        return batch
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = _connect()
+            rows = [_row(roster, character) for roster, character in batch]
+            # IMMEDIATE takes the write lock before the clock is read, so across every
+            # worker `created` rises with id and a time range is also an id range
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                created = time.time()
+                self.connection.executemany(INSERT, [(created,) + row for row in rows])
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        except (sqlite3.Error, OSError, KeyError, TypeError, ValueError) as error:
+            logger.error("could not save %d characters to the roster: %s", len(batch), error)
+            self.count("failed", len(batch))
+            return
+        COMMIT_SECONDS.observe(time.perf_counter() - start)
+        self.count("saved", len(batch))
+
+
+_writer = _Writer("roster-writer", ROSTER_QUEUE_SIZE, ("saved", "failed"))
+stats = _writer.stats
+depth = _writer.depth
+# Commits what's queued before the process exits
+drain = _writer.drain
+
+
+def check_capacity(count=1):
+    if not configured():
+        raise NotConfigured()
+    _writer.check_capacity(count)
+
+
+def save(characters, roster="", check=True):
+    # Returns straight away; this process's writer thread commits them in batches.
+    # check=False is for a stream that already called check_capacity for all of it.
+    characters = list(characters)
+    if check:
+        check_capacity(len(characters))
+    _writer.put((roster, characters), len(characters), check=False)
+
+
+def _entry(row):
+    character_id, created, roster, level, code, sheet = row
+    character = json.loads(sheet)
+    character["level"] = level
+    if code is not None:
+        character["code"] = code
+    return {"id": character_id, "created": created, "roster": roster, "character": character}
+
+
+def _first_id_since(connection, when):
+    # The first id created at or after `when`, or one past the end
+    row = connection.execute(
+        "SELECT id FROM characters WHERE created >= ? ORDER BY created, id LIMIT 1", (when,)).fetchone()
+    if row is None:
+        row = connection.execute("SELECT coalesce(max(id), 0) + 1 FROM characters").fetchone()
+    return row[0]
+
+
+def list_characters(filters, since=None, until=None, before=None, limit=50):
+    # Newest first. Pages are keyed on id rather than OFFSET, so page 10,000 costs the
+    # same as page 1: pass the last id of one page as `before` to get the next.
+    # Returns (entries, the `before` for the next page or None).
+    connection = _reader()
+    clauses, params = [], []
+    for column in FILTER_COLUMNS:
+        value = filters.get(column)
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("id >= ?")
+        params.append(_first_id_since(connection, since))
+    if until is not None:
+        clauses.append("id < ?")
+        params.append(_first_id_since(connection, until))
+    if before is not None:
+        clauses.append("id < ?")
+        params.append(before)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = connection.execute(f"{SELECT}{where} ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+    entries = [_entry(row) for row in rows]
+    return entries, (entries[-1]["id"] if len(entries) == limit else None)
+
+
+def get_characters(ids):
+    # {id: entry} for the ids that exist
+    connection = _reader()
+    ids = list(ids)
+    found = {}
+    for start in range(0, len(ids), FETCH_CHUNK):
+        chunk = ids[start:start + FETCH_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        for row in connection.execute(f"{SELECT} WHERE id IN ({placeholders})", chunk):
+            found[row[0]] = _entry(row)
+    return found
+
+
+def get_character(character_id):
+    return get_characters([character_id]).get(character_id)
@@ -0,0 +1,40 @@
+import math
+
+from permutation import mix64
+
+
+class AliasTable:
+    # Vose's alias method: O(n) to build, then one uniform number and one comparison
+    # per draw from any discrete distribution, however skewed the weights
+
+    __slots__ = ("size", "probability", "alias")
+
+    def __init__(self, weights):
+        weights = [float(weight) for weight in weights]
+        total = sum(weights)
+        if not weights or not 0 < total < math.inf or min(weights) < 0:
+            raise ValueError("weights must be non-negative with a positive, finite total")
+        self.size = len(weights)
+        scaled = [weight * self.size / total for weight in weights]
+        self.probability = [1.0] * self.size
+        self.alias = list(range(self.size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            self.probability[low] = scaled[low]
+            self.alias[low] = high
+            scaled[high] += scaled[low] - 1.0
+            (small if scaled[high] < 1.0 else large).append(high)
+        # Whatever is left over is 1.0 up to rounding error
+
+    def sample(self, u):
+        # u is uniform on [0, 1); the integer part picks a column, the rest a side
+        u *= self.size
+        column = int(u)
+        return column if u - column < self.probability[column] else self.alias[column]
+
+
+def hashed_uniform(key, counter):
+    # Uniform float on [0, 1) from a 64-bit key and a draw counter, with no rng state
+    return (mix64(key + counter * 0x9E3779B97F4A7C15) >> 11) * (1.0 / (1 << 53))
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The app reads its settings at import time. Rate limits and the PDF cache would
+# otherwise answer repeated test requests with 429s and cache hits.
+os.environ.setdefault("METRICS_DIR", "")
+os.environ.setdefault("RATE_LIMIT_GENERATE", "0")
+os.environ.setdefault("RATE_LIMIT_PDF", "0")
+os.environ.setdefault("RATE_LIMIT_CONTACT", "0")
+os.environ.setdefault("PDF_CACHE_BYTES", "0")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import admission
+import application
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def client():
+    return application.app.test_client()
+
+
+@pytest.fixture
+def fresh_buckets(monkeypatch):
+    monkeypatch.setattr(admission, "buckets", admission.LocalBuckets(16))
+
+
+def test_rate_limit_answers_429_with_retry_after(client, fresh_buckets, monkeypatch):
+    monkeypatch.setitem(admission.RATE_LIMITS, "generate", (0.5, 2.0))
+    assert client.get("/generate").status_code == 200
+    assert client.get("/generate").status_code == 200
+    response = client.get("/generate")
+    assert response.status_code == 429
+    # One token at half a token a second
+    assert response.headers["Retry-After"] == "2"
+    # Buckets are per client and per group
+    assert client.get("/generate", environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 200
+    assert client.get("/stats/distribution?method=3d6").status_code == 200
+
+
+@pytest.mark.parametrize("buckets", [admission.LocalBuckets, admission.SharedBuckets])
+def test_buckets_refill_at_the_rate(buckets):
+    store = buckets(8)
+    now = time.monotonic()
+    assert store.take("a", 2.0, 1.0, now) == 0
+    assert store.take("a", 2.0, 1.0, now) == pytest.approx(0.5)
+    assert store.take("a", 2.0, 1.0, now + 0.5) == 0
+    assert store.take("b", 2.0, 1.0, now) == 0
+
+
+def test_concurrency_limit_holds_a_slot_for_a_whole_stream(client, monkeypatch):
+    monkeypatch.setitem(admission.CONCURRENCY_LIMITS, "generate", 1)
+    stream = client.get("/generate/batch?count=3", buffered=False)
+    assert stream.status_code == 200
+    busy = client.get("/generate")
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "1"
+
+    assert len(stream.get_data(as_text=True).splitlines()) == 3
+    stream.close()
+    assert admission.in_flight()[("generate",)] == 0
+    assert client.get("/generate").status_code == 200
+
+
+@pytest.mark.parametrize("threads, limits", [(None, [0, 0, 0]), ("8", [0, 4, 0])])
+def test_default_concurrency_limits_follow_worker_threads(threads, limits):
+    env = {key: value for key, value in os.environ.items()
+           if not key.startswith(("CONCURRENCY_LIMIT_", "GUNICORN_THREADS"))}
+    if threads is not None:
+        env["GUNICORN_THREADS"] = threads
+    result = subprocess.run([sys.executable, "-c", "import admission; print(list(admission.CONCURRENCY_LIMITS.values()))"],
+                            cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == str(limits)
+
+
+def test_oversized_body_answers_413(client, monkeypatch):
+    monkeypatch.setitem(application.app.config, "MAX_CONTENT_LENGTH", 1024)
+    response = client.post("/download_pdf", data="x" * 2048, content_type="application/json")
+    assert response.status_code == 413
+    assert "1024 bytes" in response.get_json()["error"]
@@ -0,0 +1,20 @@
+import random
+
+import pytest
+
+import application
+
+
+def test_fixed_trait_before_list_traits():
+    appearance = application._compile_appearance("Test", {
+        "template": "{skin} skin, {eyes} eyes and {hair} hair ({theme})",
+        "traits": {"skin": "green", "eyes": ["red"], "hair": ["long", "short"]},
+    }, "")
+    assert appearance(random.Random(0).choice, "Dusk") in (
+        "green skin, red eyes and long hair (Dusk)", "green skin, red eyes and short hair (Dusk)")
+    assert appearance.space == 2
+
+
+def test_format_spec_is_rejected():
+    with pytest.raises(ValueError):
+        application._compile_appearance("Test", {"template": "{eyes:>10}", "traits": {"eyes": ["red"]}}, "")
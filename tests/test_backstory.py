@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+import application
+
+
+def test_opening_fills_in_fields_once_parsed():
+    opening = application._compile_opening("{name} the {race} {char_class}, 100% {{sure}}")
+    assert opening("Ann", "Elf", "Bard") == "Ann the Elf Bard, 100% {sure}"
+    assert opening("%(race)s", "Elf", "Bard").startswith("%(race)s the Elf")
+
+
+@pytest.mark.parametrize("template", ["{title}", "{name!r}", "{name:>10}"])
+def test_opening_with_an_unsupported_field_is_rejected(template):
+    with pytest.raises(ValueError):
+        application._compile_opening(template)
+
+
+def _backstory_parts(character):
+    # (opening, event, goal, quirk) indexes, read back out of the text
+    text = character["backstory"]
+    args = character["name"], character["race"], character["class"]
+    [opening] = [i for i, fill in enumerate(application.BACKSTORY_OPENINGS) if text.startswith(fill(*args) + " ")]
+    [event] = [i for i, event in enumerate(application.BACKSTORY_EVENTS) if f", they {event}. " in text]
+    [(goal, quirk)] = [(i, j) for i, goal in enumerate(application.BACKSTORY_GOALS)
+                       for j, quirk in enumerate(application.BACKSTORY_QUIRKS)
+                       if text.endswith(f"This character {goal} and {quirk}.")]
+    return opening, event, goal, quirk
+
+
+def test_unique_batch_never_repeats_a_backstory():
+    client = application.app.test_client()
+    count = application.BACKSTORY_SPACE
+    response = client.get(f"/generate/batch?count={count}&unique=1&seed=21")
+    assert response.status_code == 200
+    characters = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len({_backstory_parts(character) for character in characters}) == count == 2160
@@ -0,0 +1,53 @@
+import json
+from collections import Counter
+
+import pytest
+
+import application
+
+
+@pytest.fixture
+def client():
+    return application.app.test_client()
+
+
+def _batch(client, query, count=200):
+    response = client.get(f"/generate/batch?count={count}&seed=11&{query}")
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_allow_list(client):
+    characters = _batch(client, "race=elf,Dwarf&class=Wizard")
+    assert {character["race"] for character in characters} == {"Elf", "Dwarf"}
+    assert {character["class"] for character in characters} == {"Wizard"}
+
+
+def test_exclude_list(client):
+    characters = _batch(client, "class_exclude=Wizard,Bard&gender_exclude=Male")
+    assert not {"Wizard", "Bard"} & {character["class"] for character in characters}
+    assert "Male" not in {character["gender"] for character in characters}
+
+
+def test_weights(client):
+    counts = Counter(character["class"] for character in _batch(client, "class_weights=Rogue:20,Fighter:0", 500))
+    assert "Fighter" not in counts
+    # 20 of 25 parts
+    assert 0.7 < counts["Rogue"] / 500 < 0.9
+
+
+def test_subclass_outside_the_class_is_refused(client):
+    response = client.get("/generate?class=Wizard&subclass=Champion")
+    assert response.status_code == 400
+    assert "class and subclass" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("weights", ["Elf:1e308,Dwarf:1e308", "Elf:inf", "Elf:nan", "Elf:-1", "Elf",
+                                     "Elf:1000001"])
+def test_bad_weights_are_refused(client, weights):
+    assert client.get(f"/generate?race_weights={weights}").status_code == 400
+
+
+def test_large_weights_within_the_cap_still_pick_from_the_list(client):
+    characters = _batch(client, "race=Elf,Dwarf&race_weights=Elf:1e6,Dwarf:1e6")
+    assert {character["race"] for character in characters} == {"Elf", "Dwarf"}
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from dice import POINT_BUY_BUDGET, POINT_BUY_COSTS, STAT_ENGINES, STAT_METHODS, STAT_NAMES, roll_stats_batch, \
+    stat_distribution
+
+KEYS = np.arange(1, 2001, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+SCORE_RANGES = {"4d6": (3, 18), "3d6": (3, 18), "standard": (8, 15), "pointbuy": (8, 15)}
+
+
+def _scores(rolled):
+    return np.stack([rolled[stat] for stat in STAT_NAMES], axis=1)
+
+
+@pytest.mark.parametrize("engine", STAT_ENGINES)
+@pytest.mark.parametrize("method", STAT_METHODS)
+def test_a_key_rolls_the_same_alone_or_in_a_batch(method, engine):
+    batch = _scores(roll_stats_batch(KEYS, 5, method=method, engine=engine))
+    for index in (0, 1, 999, 1999):
+        alone = _scores(roll_stats_batch(KEYS[index:index + 1], 5, method=method, engine=engine))
+        assert (alone[0] == batch[index]).all()
+    reversed_batch = _scores(roll_stats_batch(KEYS[::-1], 5, method=method, engine=engine))
+    assert (reversed_batch[::-1] == batch).all()
+
+
+@pytest.mark.parametrize("engine", STAT_ENGINES)
+@pytest.mark.parametrize("method", STAT_METHODS)
+@pytest.mark.parametrize("level", [1, 2, 11, 20])
+def test_scores_stay_in_range_plus_the_level_bonus(method, engine, level):
+    low, high = SCORE_RANGES[method]
+    scores = _scores(roll_stats_batch(KEYS, level, method=method, engine=engine))
+    assert scores.min() >= low + level // 2
+    assert scores.max() <= high + level // 2
+    # Wide enough a sample to reach both ends
+    if method in ("standard", "pointbuy"):
+        assert scores.min() == low + level // 2 and scores.max() == high + level // 2
+
+
+def test_standard_and_point_buy_lines_are_legal():
+    for row in _scores(roll_stats_batch(KEYS, 1, method="standard")):
+        assert sorted(row.tolist()) == [8, 10, 12, 13, 14, 15]
+    for row in _scores(roll_stats_batch(KEYS, 1, method="pointbuy")):
+        assert sum(POINT_BUY_COSTS[score] for score in row.tolist()) == POINT_BUY_BUDGET
+
+
+def test_dicts_match_the_structured_array():
+    rolled = roll_stats_batch(KEYS[:10], 3)
+    dicts = roll_stats_batch(KEYS[:10], 3, as_dicts=True)
+    assert [list(d) for d in dicts] == [list(STAT_NAMES)] * 10
+    assert [list(d.values()) for d in dicts] == _scores(rolled).tolist()
+
+
+@pytest.mark.parametrize("engine", STAT_ENGINES)
+def test_4d6_engines_follow_the_exact_distribution(engine):
+    distribution = stat_distribution("4d6")
+    assert distribution["outcomes"] == 6 ** 4
+    assert sum(score["probability"] for score in distribution["scores"]) == pytest.approx(1.0)
+    keys = np.arange(20000, dtype=np.uint64)
+    mean = _scores(roll_stats_batch(keys, 1, engine=engine)).mean()
+    assert mean == pytest.approx(distribution["expected"], abs=0.05)
@@ -0,0 +1,27 @@
+import pytest
+
+import application
+
+
+@pytest.fixture
+def client():
+    return application.app.test_client()
+
+
+def _character(**changes):
+    character = application.build_character(3, application.DEFAULT_PERSONAL_ITEM, 1234)
+    character.update(changes)
+    return character
+
+
+@pytest.mark.parametrize("name", [123, 12.5])
+def test_numeric_name_is_drawn_as_text(client, name):
+    response = client.post("/download_pdf", json=_character(name=name))
+    assert response.status_code == 200
+    assert response.data.startswith(b"%PDF")
+
+
+@pytest.mark.parametrize("changes", [{"name": ["Arin"]}, {"race": None}, {"name": "x" * 1000},
+                                     {"backstory": ["fine", 3]}, {"theme": "Dusk"}])
+def test_bad_sheet_is_refused(client, changes):
+    assert client.post("/download_pdf", json=_character(**changes)).status_code == 400
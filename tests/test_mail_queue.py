@@ -0,0 +1,154 @@
+import email
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+import application
+import mail_queue
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    # Just enough SMTP for smtplib: records each message with the number of the
+    # connection it came in on, and answers DATA with a 451 while fail_data > 0
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.fail_data = 0
+        self.lock = threading.Lock()
+        self.received = threading.Condition(self.lock)
+
+    def wait_for(self, count, timeout=10.0):
+        with self.received:
+            return self.received.wait_for(lambda: len(self.messages) >= count, timeout)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sink = self.server
+        with sink.lock:
+            sink.connections += 1
+            connection = sink.connections
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 sink")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                with sink.lock:
+                    fail = sink.fail_data > 0
+                    sink.fail_data -= fail
+                if fail:
+                    self.reply("451 try again later")
+                    continue
+                self.reply("354 go ahead")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                with sink.received:
+                    sink.messages.append((connection, data))
+                    sink.received.notify_all()
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+@pytest.fixture(scope="module")
+def sink():
+    server = SMTPSink()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def smtp(sink, monkeypatch):
+    monkeypatch.setattr(mail_queue, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(mail_queue, "SMTP_PORT", sink.server_address[1])
+    monkeypatch.setattr(mail_queue, "SMTP_SECURITY", "none")
+    monkeypatch.setattr(mail_queue, "SMTP_USERNAME", None)
+    monkeypatch.setattr(mail_queue, "MAIL_RETRY_DELAY", 0.05)
+    with sink.lock:
+        sink.messages.clear()
+        sink.fail_data = 0
+    return sink
+
+
+def _message(number):
+    message = MIMEText(f"message {number}")
+    message["Subject"] = f"test {number}"
+    message["From"] = "app@example.com"
+    message["To"] = "panda@example.com"
+    return message
+
+
+def test_contact_form_is_delivered(smtp):
+    client = application.app.test_client()
+    response = client.post("/contact", data={"name": "Tester", "email": "tester@example.com",
+                                             "message": "Hello from the contact form"})
+    assert response.status_code == 202
+    assert smtp.wait_for(1)
+    message = email.message_from_bytes(smtp.messages[0][1])
+    assert message.get_payload(decode=True) == b"Hello from the contact form"
+    assert message["Reply-To"] == "tester@example.com"
+
+
+def test_messages_share_one_connection(smtp):
+    for number in range(10):
+        mail_queue.enqueue(_message(number))
+    assert smtp.wait_for(10)
+    assert len({connection for connection, _ in smtp.messages}) == 1
+
+
+def test_transient_failure_is_retried_with_backoff(smtp):
+    before = mail_queue.stats()
+    smtp.fail_data = 2
+    start = time.monotonic()
+    mail_queue.enqueue(_message(0))
+    assert smtp.wait_for(1)
+    # Two failed attempts wait MAIL_RETRY_DELAY, then twice that
+    assert time.monotonic() - start >= 0.05 + 0.1
+    assert mail_queue.stats()["retried"] - before["retried"] == 2
+    assert mail_queue.stats()["failed"] == before["failed"]
+
+
+def test_full_queue_answers_503(smtp, monkeypatch):
+    monkeypatch.setattr(mail_queue._outbox, "maxsize", 0)
+    client = application.app.test_client()
+    response = client.post("/contact", json={"email": "tester@example.com", "message": "Hi"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(application.CONTACT_RETRY_AFTER)
+
+
+def test_smtp_settings_are_read_from_dotenv(tmp_path):
+    # A fresh interpreter, since the app reads its settings once on import. With -c
+    # there is no __main__ file, so load_dotenv() looks for .env in the working directory.
+    (tmp_path / ".env").write_text("SMTP_HOST=127.0.0.1\nSMTP_PORT=2525\n")
+    env = {key: value for key, value in os.environ.items() if not key.startswith("SMTP_")}
+    env["PYTHONPATH"] = APP_DIR
+    result = subprocess.run(
+        [sys.executable, "-c", "import application, mail_queue; "
+                               "print(mail_queue.SMTP_HOST, mail_queue.SMTP_PORT, mail_queue.configured())"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ["127.0.0.1", "2525", "True"]
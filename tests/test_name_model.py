@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import application
+import name_model
+
+POOLS = {
+    "elf": (("Aerin", "Liriel", "Thamior", "Sariel", "Eladrin"), ("Galanodel", "Siannodel", "Amakiir")),
+    "dwarf": (("Bruenor", "Dagnal", "Harbek", "Orsik"), ("Battlehammer", "Ironfist", "Frostbeard")),
+}
+GENERIC = (("Arin", "Lira"), ("Ironwood", "Duskblade"))
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(name_model, "NAME_MODEL_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_same_seed_same_name(cache_dir):
+    model = name_model.load_or_train(POOLS, GENERIC)
+    again = name_model.load_or_train(POOLS, GENERIC)
+    for seed in (0, 1, 2 ** 64 - 1):
+        assert model.full_name("elf", seed) == again.full_name("elf", seed)
+    names = {model.full_name("elf", seed) for seed in range(200)}
+    assert len(names) > 50
+    # A race with no pool of its own is served by the generic model
+    assert model.full_name("tabaxi", 5) == model.full_name(None, 5)
+
+
+def test_compiled_tables_are_loaded_from_the_cache(cache_dir, monkeypatch):
+    model = name_model.load_or_train(POOLS, GENERIC)
+    [cached] = cache_dir.glob("dnd-name-model-*.npz")
+
+    def no_training(*args, **kwargs):
+        raise AssertionError("trained again instead of loading the cache")
+
+    monkeypatch.setattr(name_model, "compile_tables", no_training)
+    assert name_model.load_or_train(POOLS, GENERIC).tables == model.tables
+    # A different corpus is a different file
+    with pytest.raises(AssertionError):
+        name_model.load_or_train(dict(POOLS, gnome=(("Alston",), ("Garrick",))), GENERIC)
+    assert cached.exists()
+
+
+def test_unreadable_cache_is_rebuilt(cache_dir):
+    model = name_model.load_or_train(POOLS, GENERIC)
+    [cached] = cache_dir.glob("dnd-name-model-*.npz")
+    cached.write_bytes(b"not a model")
+    assert name_model.load_or_train(POOLS, GENERIC).tables == model.tables
+
+
+def test_unique_full_name_stays_within_one_byte_of_draws(cache_dir):
+    model = name_model.load_or_train(POOLS, GENERIC)
+    name, draw = model.unique_full_name("elf", 7, set())
+    assert (name, draw) == (model.full_name("elf", 7), 0)
+    name, draw = model.unique_full_name("elf", 7, {model.full_name("elf", 7)})
+    assert draw >= 1 and name == model.full_name("elf", 7, draw)
+    # Every draw collides: it gives up on the last one a share code can hold
+    model.tables = {(None, "first"): ("Arin",), (None, "last"): ("Ironwood",)}
+    name, draw = model.unique_full_name("elf", 7, {"Arin Ironwood"})
+    assert draw == 255
+    application.encode_share_code(7, 1, application.DEFAULT_PERSONAL_ITEM, name_draw=draw)
+
+
+@pytest.mark.parametrize("generator", ["markov", "pool"])
+def test_unique_names_in_a_batch(generator, monkeypatch):
+    monkeypatch.setattr(application, "NAME_GENERATOR", generator)
+    client = application.app.test_client()
+    # 80 of the 100 names the dwarf pool can make
+    response = client.get("/generate/batch?count=80&seed=8&race=Dwarf&unique_names=1")
+    characters = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len({character["name"] for character in characters}) == 80
+    for character in characters[-20:]:
+        assert client.get(f"/character/{character['code']}").get_json() == character
@@ -0,0 +1,11 @@
+import application
+
+
+def test_posted_and_shared_sheet_share_an_etag():
+    client = application.app.test_client()
+    character = client.get("/generate?level=4").get_json()
+    posted = client.post("/download_pdf", json=character)
+    shared = client.get(f"/character/{character['code']}?format=pdf")
+    assert posted.status_code == shared.status_code == 200
+    assert posted.headers["ETag"] == shared.headers["ETag"]
+    assert posted.data == shared.data
@@ -0,0 +1,32 @@
+import time
+
+import application
+import prefetch
+
+
+def _stage_counts(prefix):
+    return {labels: sample[1] if isinstance(sample, list) else sample
+            for labels, sample in application.STAGE_SECONDS.snapshot().items() if labels[0].startswith(prefix)}
+
+
+def test_first_pop_starts_refill_and_stages_are_labelled_apart():
+    buffers = prefetch.PrefetchBuffers(application._prefetch_body, size=4, low_watermark=2)
+    generate_before = _stage_counts("generate.")
+    key = (2, application.DEFAULT_PERSONAL_ITEM)
+
+    assert buffers.pop(key) is None
+    assert buffers.running()
+    deadline = time.monotonic() + 10
+    while buffers.stats()["buffered"] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    body = buffers.pop(key)
+    assert body is not None and '"level":2' in body.replace(" ", "")
+    assert _stage_counts("prefetch.")
+    assert _stage_counts("generate.") == generate_before
+
+
+def test_disabled_buffers_never_start():
+    buffers = prefetch.PrefetchBuffers(application._prefetch_body, enabled=False)
+    assert buffers.pop((1, application.DEFAULT_PERSONAL_ITEM)) is None
+    assert not buffers.running()
@@ -0,0 +1,48 @@
+import pytest
+
+import application
+from progression import ASI_LEVELS, MAX_LEVEL, PROGRESSION_COLUMNS, build_progression_tables
+
+TABLES = build_progression_tables(application.hit_dice, default_hit_die=8)
+
+
+def _row(char_class, base_con, level):
+    return dict(zip(PROGRESSION_COLUMNS, TABLES[char_class, base_con][level - 1]))
+
+
+def test_level_one_takes_the_whole_hit_die():
+    # d6 + CON 14's +2
+    row = _row("Wizard", 14, 1)
+    assert row["hp_min"] == row["hp_max"] == row["hp_avg"] == 8
+    assert row["proficiency_bonus"] == 2
+
+
+def test_later_levels_add_one_die_each_with_con_growing():
+    # Level 5: CON 14 + 2 is 16, +3, applied to every level
+    row = _row("Fighter", 14, 5)
+    assert (row["hp_min"], row["hp_max"], row["hp_avg"]) == (13 + 4 * 4, 13 + 4 * 13, 13 + 4 * 9)
+    assert row["proficiency_bonus"] == 3
+
+
+def test_hit_points_never_drop_below_one_per_level():
+    # CON 4 at level 2 is -3: 6 - 3 at level 1, then a roll of 1 - 3 still counts as 1
+    row = _row("Wizard", 3, 2)
+    assert (row["hp_min"], row["hp_max"]) == (3 + 1, 3 + 3)
+
+
+@pytest.mark.parametrize("char_class, extra", [("Wizard", ()), ("Fighter", (6, 14)), ("Rogue", (10,))])
+def test_asi_levels(char_class, extra):
+    asi = [level for level in range(1, MAX_LEVEL + 1) if _row(char_class, 10, level)["asi"]]
+    assert asi == sorted(set(ASI_LEVELS) | set(extra))
+
+
+def test_unknown_class_uses_the_default_hit_die():
+    assert _row(None, 10, 1)["hp_max"] == 8
+    assert set(TABLES) >= {(char_class, con) for char_class in application.hit_dice for con in range(3, 19)}
+
+
+def test_generated_character_matches_its_table_row():
+    character = application.build_character(7, application.DEFAULT_PERSONAL_ITEM, 42)
+    base_con = character["stats"]["CON"] - 7 // 2
+    row = _row(character["class"], base_con, 7)
+    assert character["hp_range"] == f"{row['hp_min']}–{row['hp_max']}"
@@ -0,0 +1,49 @@
+import os
+import signal
+
+import pytest
+
+import application
+import render_pool
+
+
+@pytest.fixture
+def client():
+    return application.app.test_client()
+
+
+def _character():
+    return application.build_character(3, application.DEFAULT_PERSONAL_ITEM, 1234)
+
+
+def _kill_pool_children():
+    executor = render_pool.get_executor()
+    for process in list(executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+
+def test_download_pdf_survives_a_killed_render_child(client):
+    assert client.post("/download_pdf", json=_character()).status_code == 200
+    _kill_pool_children()
+
+    response = client.post("/download_pdf", json=_character())
+    assert response.status_code == 200
+    assert response.data.startswith(b"%PDF")
+    assert not render_pool.get_executor()._broken
+
+
+def test_job_lost_with_its_child_is_retried():
+    character = _character()
+    render_pool.submit(render_pool.os.getpid).result()
+    _kill_pool_children()
+    # Submitted to the dead pool before it is noticed, then run again on a new one
+    assert render_pool.submit(application.render_sheet_bytes, character).result().startswith(b"%PDF")
+
+
+def test_bulk_export_survives_a_killed_render_child(client):
+    client.post("/download_pdf", json=_character())
+    _kill_pool_children()
+    response = client.post("/download_pdf/bulk", json={"count": 3, "seed": 7})
+    assert response.status_code == 200
+    assert response.data[:2] == b"PK"
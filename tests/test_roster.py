@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+import application
+import roster
+
+
+@pytest.fixture(scope="module", autouse=True)
+def roster_db(tmp_path_factory):
+    # The reader and writer keep their connections for the life of the process, so the
+    # whole module shares one database; each test saves under its own roster name
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(roster, "ROSTER_DB", str(tmp_path_factory.mktemp("roster") / "roster.db"))
+        patch.setattr(roster, "_schema_pid", None)
+        yield
+
+
+@pytest.fixture
+def client():
+    return application.app.test_client()
+
+
+def _save(client, name, **payload):
+    response = client.post("/roster", json=dict(payload, roster=name))
+    assert response.status_code == 202
+    roster.drain()
+    assert roster.depth() == 0
+    return response.get_json()["count"]
+
+
+def _pages(client, query):
+    ids, before = [], None
+    while True:
+        url = f"/roster?{query}" + (f"&before={before}" if before is not None else "")
+        page = client.get(url).get_json()
+        ids.extend(entry["id"] for entry in page["characters"])
+        before = page["next"]
+        if before is None:
+            return ids
+
+
+def test_pages_cover_every_character_once_newest_first(client):
+    assert _save(client, "paging", count=23, seed=1) == 23
+    ids = _pages(client, "roster=paging&limit=5")
+    assert len(ids) == len(set(ids)) == 23
+    assert ids == sorted(ids, reverse=True)
+    # A full last page still says there may be more; the next one is empty
+    assert _pages(client, "roster=paging&limit=23") == ids
+
+
+def test_filters(client):
+    _save(client, "filters", count=60, seed=2, level=7)
+    _save(client, "filters", count=5, seed=3, level=2)
+    entries = client.get("/roster?roster=filters&race=elf&limit=500").get_json()["characters"]
+    assert entries and {entry["character"]["race"] for entry in entries} == {"Elf"}
+    entries = client.get("/roster?roster=filters&class=Bard&level=2&limit=500").get_json()["characters"]
+    assert all(entry["character"]["class"] == "Bard" and entry["character"]["level"] == 2 for entry in entries)
+    assert len(client.get("/roster?roster=filters&level=2").get_json()["characters"]) == 5
+    assert client.get("/roster?roster=nobody").get_json() == {"characters": [], "next": None}
+
+
+def test_since_and_until(client):
+    _save(client, "window", count=3, seed=4)
+    between = time.time()
+    time.sleep(0.01)
+    _save(client, "window", count=2, seed=5)
+    assert len(_pages(client, f"roster=window&since={between}")) == 2
+    assert len(_pages(client, f"roster=window&until={between}")) == 3
+    assert client.get("/roster?since=yesterday").status_code == 400
+
+
+def test_saved_character_and_its_pdf(client):
+    character = client.get("/generate?level=9").get_json()
+    _save(client, "single", characters=[character])
+    [entry] = client.get("/roster?roster=single").get_json()["characters"]
+    assert entry["character"]["name"] == character["name"]
+    assert entry["character"]["code"] == character["code"]
+    assert client.get(f"/roster/{entry['id']}").get_json() == entry
+    pdf = client.get(f"/roster/{entry['id']}/pdf")
+    assert pdf.status_code == 200 and pdf.data.startswith(b"%PDF")
+    assert client.get("/roster/999999999/pdf").status_code == 404
+
+
+@pytest.mark.parametrize("payload", [
+    [1, 2],
+    {"roster": 5, "count": 1},
+    {"roster": "x" * 101, "count": 1},
+    {"count": 0},
+    {"count": application.BATCH_MAX_COUNT + 1},
+    {"codes": ["not-a-code"]},
+    {"characters": [{"name": "Arin"}]},
+    {"nothing": True},
+])
+def test_bad_saves_are_refused(client, payload):
+    before = roster.stats()["queued"]
+    assert client.post("/roster", json=payload).status_code == 400
+    assert roster.stats()["queued"] == before
+
+
+def test_sheet_without_a_valid_level_is_refused(client):
+    character = client.get("/generate").get_json()
+    character["level"] = 99
+    assert client.post("/roster", json={"characters": [character]}).status_code == 400
+
+
+def test_not_configured(client, monkeypatch):
+    monkeypatch.setattr(roster, "ROSTER_DB", None)
+    assert client.post("/roster", json={"count": 1}).status_code == 503
+    assert client.get("/roster").status_code == 503
@@ -0,0 +1,85 @@
+import base64
+import json
+
+import pytest
+
+import application
+
+
+@pytest.fixture
+def client():
+    return application.app.test_client()
+
+
+def _as_json(character):
+    return json.loads(application.app.json.dumps(character))
+
+
+def _flags(code):
+    return base64.urlsafe_b64decode(code + "=" * (-len(code) % 4))[0]
+
+
+@pytest.mark.parametrize("query, flags", [
+    ("", 0),
+    ("?level=20&seed=5", 0),
+    ("?personal_item=a%20glass%20eye%20%E2%80%94%20not%20theirs", application.CODE_CUSTOM_ITEM),
+    ("?race=Elf,Dwarf&class_exclude=Wizard&theme_weights=Arcane%20Whispers:5", application.CODE_PICKS),
+    ("?stats_method=pointbuy", application.CODE_STATS),
+])
+def test_generated_character_round_trips(client, query, flags):
+    character = client.get(f"/generate{query}").get_json()
+    assert _flags(character["code"]) == flags
+    assert client.get(f"/character/{character['code']}").get_json() == character
+
+
+def test_seed_is_a_string_that_reproduces_the_character(client):
+    character = client.get("/generate?seed=18446744073709551557").get_json()
+    assert character["seed"] == "18446744073709551557"
+    assert client.get(f"/generate?seed={character['seed']}").get_json() == character
+
+
+def test_unique_batch_codes_round_trip(client):
+    lines = client.get("/generate/batch?count=20&unique=1&seed=3").get_data(as_text=True).splitlines()
+    for line in lines:
+        character = json.loads(line)
+        assert _flags(character["code"]) & application.CODE_COMBO
+        assert client.get(f"/character/{character['code']}").get_json() == character
+
+
+def test_name_draw_round_trips(client):
+    first = application.build_character(3, application.DEFAULT_PERSONAL_ITEM, 99)
+    # The seed's first name is taken, so a later draw goes in the code
+    character = application.build_character(3, application.DEFAULT_PERSONAL_ITEM, 99, used_names={first["name"]})
+    assert character["name"] != first["name"]
+    assert _flags(character["code"]) == application.CODE_NAME
+    assert client.get(f"/character/{character['code']}").get_json() == _as_json(character)
+
+
+@pytest.mark.parametrize("engine", ["dice", "alias"])
+def test_code_keeps_the_stats_engine(client, engine):
+    character = application.build_character(5, application.DEFAULT_PERSONAL_ITEM, 1234, stats_engine=engine)
+    assert client.get(f"/character/{character['code']}").get_json() == _as_json(character)
+
+
+def test_engine_changes_the_rolls_but_not_old_codes():
+    dice = application.build_character(5, application.DEFAULT_PERSONAL_ITEM, 1234, stats_engine="dice")
+    alias = application.build_character(5, application.DEFAULT_PERSONAL_ITEM, 1234, stats_engine="alias")
+    assert dice["stats"] != alias["stats"]
+    # Codes made before the engine was recorded are dice codes
+    assert application.decode_share_code(dice["code"])[-1] == "dice"
+    assert len(dice["code"]) < len(alias["code"])
+
+
+def test_bad_codes_are_refused(client):
+    code = application.encode_share_code(1234, 3, application.DEFAULT_PERSONAL_ITEM)
+    picks = application.encode_share_code(1234, 3, application.DEFAULT_PERSONAL_ITEM, picks=(0, 0, 0, 0, 0, 0))
+    for bad in ("A", "not-a-code", "!!!!", code[:-2], code[:5], code + "AAAA", picks[:-4],
+                application.encode_share_code(1234, 3, application.DEFAULT_PERSONAL_ITEM, picks=(0, 0, 9, 0, 0, 0)),
+                application.encode_share_code(1234, 3, "x" * (application.MAX_PERSONAL_ITEM_LENGTH + 1))):
+        assert client.get(f"/character/{bad}").status_code == 400, bad
+
+
+@pytest.mark.parametrize("level", [0, 21, 255])
+def test_level_outside_range_is_refused(client, level):
+    code = application.encode_share_code(1234, level, application.DEFAULT_PERSONAL_ITEM)
+    assert client.get(f"/character/{code}").status_code == 400